@@ -1,29 +1,19 @@
 import logging
-import re
 from datetime import datetime
-from typing import Union
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union
 
-from psycopg2 import extensions, extras
+from parsing import NON_ALPHANUMERIC_PATTERN
+from source import DEFAULT_SOURCE
 
-# from scraper import DateTimeUpdater
-
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+if TYPE_CHECKING:
+    from psycopg2 import extensions
 
-file_handler = logging.FileHandler('app.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+    from database_lib import ConnectionPool
 
+# from scraper import DateTimeUpdater
 
-class CollectionSizeMismatch(Exception):
-    def __int__(self, message: str):
-        self.message = message
-        super().__init__(self.message)
+logger = logging.getLogger(__name__)
 
 
 class AnnouncementFormatterInterface:
@@ -31,6 +21,12 @@ class AnnouncementFormatterInterface:
         pass
 
 
+class CheckStringIndexInterface:
+    def get_existing_check_strings(self, check_strings: list) -> set:
+        """Returns the check strings from the given list that are already stored"""
+        pass
+
+
 class AnnouncementCollection:
     def __init__(self):
         self.announcements = {}
@@ -107,30 +103,12 @@ class AnnouncementCollection:
         logger.info('Collection sorted')
         return self
 
-    def get_same_day_announcements(self):
-        collection = {}
-        duplicate_announcement_list = []
-
-        if not self.is_from_db():
-            for announcement in self.announcements.values():
-                datestrkey = announcement.get_published_datetime().strftime('%d%m%Y')
-                if datestrkey in collection:
-                    collection[datestrkey].append(announcement)
-                else:
-                    collection[datestrkey] = [announcement]
-
-        for group in collection.values():
-            if len(group) > 1:
-                duplicate_announcement_list.extend(group)
-        logger.info(
-            'There are {} announcements that have similar published dates'.format(len(duplicate_announcement_list)))
-        return duplicate_announcement_list
-
     def get_tuple_list(self):
         tuple_list = []
         for announcement in self.announcements.values():
             tuple_list.append(
                 (
+                    announcement.get_source(),
                     announcement.get_title(),
                     announcement.get_url(),
                     announcement.get_check_string(),
@@ -143,10 +121,21 @@ class AnnouncementCollection:
 
 
 class AnnouncementFactory:
+    """
+    Create announcements from scraped or stored data
+
+    :param source: Name of the source of scraped announcements, stored announcements keep the source they were
+        stored with
+    """
+
+    def __init__(self, source: str = DEFAULT_SOURCE):
+        self.source = source
+
     def create_from_dict(self, announcement_dict) -> 'Announcement':
-        logger.info(
-            'Creating Announcement object from {0} data'.format('stored' if announcement_dict['id'] else 'site')
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                'Creating Announcement object from {0} data'.format('stored' if announcement_dict['id'] else 'site')
+            )
         return Announcement(
             announcement_dict['id'],
             announcement_dict['title'],
@@ -156,52 +145,112 @@ class AnnouncementFactory:
             announcement_dict['retrieved_datetime'],
             announcement_dict['stored_timestamp'],
             announcement_dict['check_string'],
+            announcement_dict.get('source') or self.source,
         )
 
     def get_announcement_collection(self, announcement_data_list: list) -> 'AnnouncementCollection':
         announcement_list = []
+        is_debug = logger.isEnabledFor(logging.DEBUG)
         for announcement_data in announcement_data_list:
             announcement = self.create_from_dict(announcement_data)
             announcement_list.append(announcement)
-            logger.info(
-                'Created Announcement object with check string: {0}...'.format(announcement.get_check_string()[0:20])
-            )
+            if is_debug:
+                logger.debug('Created Announcement object with check string: {0}...'.format(
+                    announcement.get_check_string()[0:20]))
+        logger.info('Created {} Announcement objects'.format(len(announcement_list)))
         return AnnouncementCollection().set_collection(announcement_list)
 
 
-class AnnouncementMapper:
-    def __init__(self, connection: extensions.connection):
-        self.connection = connection
+class AnnouncementMapper(CheckStringIndexInterface):
+    """
+    Store and look up announcements in the announcement table
+
+    :param source: Source whose stored announcements get_existing_check_strings() looks up
+    """
+
+    def __init__(self, database: 'ConnectionPool', source: str = DEFAULT_SOURCE):
+        self.database = database
+        self.source = source
         self.factory = None
 
-    def save_all(self, collection: AnnouncementCollection):
+    def save_all(self, collection: AnnouncementCollection) -> AnnouncementCollection:
+        """
+        Store the announcements of the collection in one statement per 1000 rows
+
+        Announcements that are already stored (same source and check string) only get their updated datetime updated,
+        so saving the same collection twice does not duplicate rows.
+
+        :return: A collection of the announcements that were not stored before
+        """
         sql = 'INSERT INTO ' \
-              'announcement(title, url, check_string, published_datetime, updated_datetime, retrieved_datetime) ' \
-              'VALUES (%s, %s, %s, %s, %s, %s)'
+              'announcement(source, title, url, check_string, published_datetime, updated_datetime, ' \
+              'retrieved_datetime) ' \
+              'VALUES %s ' \
+              'ON CONFLICT (source, check_string) DO UPDATE SET updated_datetime = EXCLUDED.updated_datetime ' \
+              'RETURNING check_string, (xmax = 0) AS inserted'  # xmax is 0 for a row inserted, not updated
+        from psycopg2 import extras  # the driver is only loaded by runs that reach the database
+
         var_list = collection.get_tuple_list()
-        cursor: extensions.cursor = self.connection.cursor()
-        result = cursor.executemany(sql, var_list)
-        self.connection.commit()
-        logger.info('Collection stored in database') if result is None else ''
-        return result
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            result = extras.execute_values(cursor, sql, var_list, page_size=1000, fetch=True)
+        inserted = [collection.get(check_string) for check_string, is_inserted in result if is_inserted]
+        logger.info('Collection stored in database. {0} of {1} announcements are new'.format(
+            len(inserted), collection.get_size()))
+        return AnnouncementCollection().set_collection(inserted)
+
+    def get_existing_check_strings(self, check_strings: list) -> set:
+        """
+        Returns the check strings from the given list that are already stored for the source of the mapper
+
+        A single query for any number of check strings, answered from the unique index on source and check_string
+        """
+        if len(check_strings) == 0:
+            return set()
+        sql = 'SELECT check_string FROM announcement WHERE source = %s AND check_string = ANY(%s)'
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            cursor.execute(sql, (self.source, check_strings))
+            return {row[0] for row in cursor.fetchall()}
 
     def get_recent_announcements(self, factory: 'AnnouncementFactory') -> 'AnnouncementCollection':
+        from psycopg2 import extras
+
         self.factory = factory
         sql = 'select * from announcement order by published_datetime DESC limit 10'
-        cursor: extensions.cursor = self.connection.cursor(cursor_factory=extras.DictCursor)
-        cursor.execute(sql)
-        result = cursor.fetchall()
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor(cursor_factory=extras.DictCursor)
+            cursor.execute(sql)
+            result = cursor.fetchall()
         announcement_collection = factory.get_announcement_collection(result)
         return announcement_collection
 
 
+@lru_cache(maxsize=4096)
+def get_date_key(day: int, month: int, year: int) -> str:
+    """Announcements of the same day share one date key string"""
+    return '{0:02d}{1:02d}{2:04d}'.format(day, month, year)
+
+
 class Announcement:
+    """
+    An announcement scraped from the site or read from the database
+
+    Uses __slots__ and keeps the published date key (ddmmyyyy) precomputed so large collections stay small and
+    accessors do no formatting or logging. Set the announcement logger to DEBUG to trace object creation and updates.
+    """
+
+    __slots__ = ('id', 'title', 'url', 'published_datetime', 'updated_datetime', 'retrieved_datetime',
+                 'stored_timestamp', 'check_string', 'date_key', 'source')
+
     def __init__(self, post_id, title, url, published_datetime, updated_datetime, retrieved_datetime, stored_timestamp,
-                 check_string):
+                 check_string, source=DEFAULT_SOURCE):
         self.id = post_id
+        self.source = source
         self.title = title
         self.url = url
         self.published_datetime = published_datetime
+        self.date_key = self.get_date_key_from_datetime(published_datetime)
         self.updated_datetime = updated_datetime
         self.retrieved_datetime = retrieved_datetime
         self.stored_timestamp = stored_timestamp
@@ -211,14 +260,18 @@ class Announcement:
             self.check_string = check_string
 
     def __str__(self) -> str:
-        return self.get_title() + ' ' + self.get_published_datetime().strftime('%d-%m-%Y')
+        date_key = self.date_key
+        return '{0} {1}-{2}-{3}'.format(self.title, date_key[0:2], date_key[2:4], date_key[4:])
 
     def generate_check_string(self) -> str:
-        logger.info('Generating check string')
-        title_lowercase = self.get_title().lower()
-        title_alphanum_no_space = re.sub(r'[^A-Za-z0-9]', "", title_lowercase)
-        date_num = self.get_published_datetime().strftime('%d%m%Y')
-        return title_alphanum_no_space + date_num
+        title_lowercase = self.title.lower()
+        title_alphanum_no_space = NON_ALPHANUMERIC_PATTERN.sub('', title_lowercase)
+        return title_alphanum_no_space + self.date_key
+
+    @staticmethod
+    def get_date_key_from_datetime(dt: datetime) -> str:
+        """Returns the date as ddmmyyyy, the same as dt.strftime('%d%m%Y')"""
+        return get_date_key(dt.day, dt.month, dt.year)
 
     def get_id(self) -> str:
         return self.id
@@ -230,12 +283,12 @@ class Announcement:
         return self.url
 
     def get_published_datetime(self) -> datetime:
-        if self.published_datetime.strftime('%H%M%S') == '000000':
-            logger.info('getting only published date')
-        else:
-            logger.info('getting published date and time')
         return self.published_datetime
 
+    def get_date_key(self) -> str:
+        """Returns the published date as ddmmyyyy"""
+        return self.date_key
+
     def get_updated_datetime(self) -> Union[None, datetime]:
         return self.updated_datetime
 
@@ -248,38 +301,41 @@ class Announcement:
     def get_check_string(self) -> str:
         return self.check_string
 
+    def get_source(self) -> str:
+        return self.source
+
     def set_published_datetime(self, dt: datetime) -> 'Announcement':
-        logger.info('setting published datetime')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('setting published datetime of {0}'.format(self.check_string))
         self.published_datetime = dt
+        self.date_key = self.get_date_key_from_datetime(dt)
         return self
 
     def set_updated_datetime(self, dt: datetime) -> 'Announcement':
-        logger.info('setting updated datetime')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('setting updated datetime of {0}'.format(self.check_string))
         self.updated_datetime = dt
         return self
 
 
 class Comparator:
-    def __init__(self, a: AnnouncementCollection, b: AnnouncementCollection, dtu: 'DateTimeUpdater'):
-        web = a
-        stored = b
-        if a.is_from_db():
-            web = b
-            stored = a
-        self.web_collection = web
-        self.stored_collection = stored
+    """
+    Find the scraped announcements that are not stored
+
+    Stored announcements are looked up by check string in a single query, so the scraped collection can be any size
+    and only stored announcements that match a scraped one are read.
+    """
+
+    def __init__(self, web_collection: AnnouncementCollection, index: CheckStringIndexInterface):
+        self.web_collection = web_collection
+        self.index = index
         self.new_announcements = AnnouncementCollection()
-        self.datetime_updater = dtu
 
     def check_for_new_announcements(self) -> 'Comparator':
-        if self.stored_collection.get_size() != self.web_collection.get_size():
-            raise CollectionSizeMismatch('Cannot compare collections. Not the same size')
-        self.web_collection = self.datetime_updater.resolve_same_day_announcements(self.web_collection)
-        self.web_collection.sort()
-        self.stored_collection.sort()
+        stored = self.index.get_existing_check_strings(list(self.web_collection))
         new_announcements = []
         for key in self.web_collection:
-            if key not in self.stored_collection:
+            if key not in stored:
                 new_announcements.append(self.web_collection.get(key))
         self.new_announcements.set_collection(new_announcements)
         return self
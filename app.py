@@ -1,71 +1,516 @@
+"""
+Entry point of the notifier
+
+Only the modules needed to fetch the announcement page are imported at start up. The HTML parser, the announcement
+model, the database driver and the notification agents are imported by the stage that first uses them, so a cron run
+whose page has not changed neither loads them nor opens a database connection.
+"""
+import argparse
 import logging
+import os
+import signal
 import sys
+import threading
 import traceback
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterator, Union
 
-from announcement import AnnouncementFactory, AnnouncementMapper, Comparator
-from database_lib import db_connection, JsonAdapter
-from notification import TexitSubscriberFilter, TexitMessageFormatter, TextitNotifier, TextitAgent, TextitErrorReporter
-from scraper import DocumentFetcher, Scraper, DateTimeUpdater
-from subscriber import SubscriberFactory, SubscriberMapper
+from cache_lib import ValidatorCache
+from env_lib import load_environment
+from fetcher import DocumentFetcher, TokenBucketRateLimiter
+from http_lib import HttpClient
+from logging_lib import configure_logging
+from metrics import metrics, profile
+from source import DEFAULT_SOURCE, Source, load_sources
 
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+if TYPE_CHECKING:
+    from announcement import AnnouncementCollection
+    from database_lib import ConnectionPool
+    from notification import EmailAgent
+    from scraper import DateTimeUpdater
+    from subscriber import SubscriberCollection, SubscriberFilterInterface, SubscriberMapper
 
-file_handler = logging.FileHandler('app.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
+logger = logging.getLogger(__name__)
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+load_environment()  # the settings below read the environment
 
+log_file = './app.log'
 target_class_names = 'post-6 page type-page status-publish hentry'
 target_id_name = 'post-6'
 html_element = 'article'
-target_url = 'http://bit.lk/index.php/category/announcement/page/1'
+target_page_url = 'http://bit.lk/index.php/category/announcement/page/{}'
+sources_file = os.environ.get('SOURCES_FILE', './sources.json')  # without it the target settings above are polled
+source_workers = 8  # sources polled at once
+fetch_rate = 2.0  # requests per second to a single host
+fetch_burst = 10  # requests allowed to a single host at once
+fetch_workers = 5
+validator_cache_file = './validator_cache.json'
+http_connect_timeout = 5.0
+http_read_timeout = 30.0
+textit_batch_size = 100  # recipients per gateway request
+textit_workers = 4  # gateway requests in flight at once
+textit_digest = False  # send the announcements of a run as one message instead of a message per announcement
+textit_digest_segments = 3  # most SMS segments a digest may take, announcements that do not fit are linked
+email_batch_size = 50  # envelope recipients per email
+notification_channels = os.environ.get('NOTIFICATION_CHANNELS', 'textit').split(',')  # textit, email
+http_host_pool_sizes = {'bit.lk': fetch_workers, 'www.textit.biz': textit_workers}
+subscribers_file = './subscribers.json'
+subscriber_store = os.environ.get('SUBSCRIBER_STORE', 'json')  # json, postgres or sqlite
+subscriber_sqlite_file = './subscribers.db'
+subscriber_batch_size = 1000
+database_pool_size = 4
+metrics_textfile = os.environ.get('METRICS_TEXTFILE', './metrics.prom')  # e.g. in the node exporter textfile dir
+run_summary_file = './run_summary.json'
+profile_file = './profile.prof'
+outbox_poll_interval = 30  # seconds between polls of a standalone delivery worker
+outbox_retry_delay = 60  # seconds before a notification that could not be delivered is sent again
+outbox_pending_file = './outbox_pending'  # exists while the last delivery left notifications undelivered
+
+
+class Pipeline:
+    """
+    Fetch the announcement pages of the sources, find new announcements, store them and notify subscribers
+
+    The HTTP session, database connection pool and subscribers are created once and reused by every run so a daemon
+    keeps them warm between polls. Everything but the HTTP client and the validator cache is created by the stage
+    that first needs it, so no database connection is opened until the pipeline needs one.
+    """
+
+    def __init__(self):
+        self.http_client = HttpClient(http_connect_timeout, http_read_timeout, host_pool_sizes=http_host_pool_sizes)
+        self.validator_cache = ValidatorCache(validator_cache_file)
+        self.fetcher = DocumentFetcher(self.validator_cache, self.http_client)
+        self.lock = threading.Lock()  # sources are polled concurrently and share what is created on first use
+        self.sources = None
+        self.datetime_updater = None
+        self.database = None
+        self.email_agent = None
+        self.subscribers = None
+        self.subscribers_mtime = None
+
+    def get_sources(self) -> list:
+        """
+        Returns the sources of the sources file, or the bit.lk announcement page of the target settings without one
+
+        The sources file is read once, a daemon has to be restarted to pick up changes
+        """
+        if self.sources is None:
+            if os.path.exists(sources_file):
+                self.sources = load_sources(sources_file)
+            else:
+                self.sources = [Source(DEFAULT_SOURCE, target_page_url, html_element, target_id_name,
+                                       target_class_names)]
+            logger.info('Polling {0} sources: {1}'.format(len(self.sources), ', '.join(map(str, self.sources))))
+        return self.sources
+
+    def get_datetime_updater(self) -> 'DateTimeUpdater':
+        with self.lock:
+            if self.datetime_updater is None:
+                from scraper import DateTimeUpdater, Scraper
+                self.datetime_updater = DateTimeUpdater(
+                    self.fetcher,
+                    Scraper(),
+                    TokenBucketRateLimiter(fetch_rate, fetch_burst),
+                    fetch_workers
+                )
+            return self.datetime_updater
+
+    def get_database(self) -> 'ConnectionPool':
+        with self.lock:
+            if self.database is None:
+                from database_lib import ConnectionPool
+                self.database = ConnectionPool(maxconn=database_pool_size)
+            return self.database
+
+    def get_email_agent(self) -> 'EmailAgent':
+        if self.email_agent is None:
+            from notification import EmailAgent
+            self.email_agent = EmailAgent(email_batch_size)
+        return self.email_agent
+
+    def get_subscribers(self) -> 'SubscriberCollection':
+        """Returns the subscribers. The subscribers file is read again only if it changed since it was last read"""
+        from database_lib import JsonAdapter
+        from subscriber import SubscriberFactory, SubscriberMapper
+
+        mtime = os.stat(subscribers_file).st_mtime
+        if self.subscribers is None or mtime != self.subscribers_mtime:
+            self.subscribers = SubscriberMapper(JsonAdapter(subscribers_file)).get_all_subscribers(SubscriberFactory())
+            self.subscribers_mtime = mtime
+        return self.subscribers
+
+    def get_subscriber_mapper(self) -> 'SubscriberMapper':
+        from database_lib import JsonAdapter, SqliteSubscriberAdapter, SubscriberTableAdapter
+        from subscriber import SubscriberMapper
+
+        if subscriber_store == 'postgres':
+            return SubscriberMapper(SubscriberTableAdapter(self.get_database()))
+        if subscriber_store == 'sqlite':
+            return SubscriberMapper(SqliteSubscriberAdapter(subscriber_sqlite_file))
+        return SubscriberMapper(JsonAdapter(subscribers_file))
+
+    def get_subscriber_batches(self, contact_type: str = None) -> Iterator['SubscriberCollection']:
+        """
+        Yields the subscribers to notify
+
+        All subscribers of the json file in one collection, or the active subscribers with the contact type of the
+        subscriber table streamed in collections of subscriber_batch_size
+        """
+        from subscriber import SubscriberFactory
+
+        if subscriber_store == 'json':
+            yield self.get_subscribers()
+            return
+        yield from self.get_subscriber_mapper().iter_subscriber_batches(
+            SubscriberFactory(), contact_type, subscriber_batch_size)
+
+    def get_recipient_batches(self, subscriber_filter: 'SubscriberFilterInterface') -> Iterator[list]:
+        """Yields the contacts of each batch of subscribers that the subscriber filter keeps"""
+        contact_type = subscriber_filter.get_contact_type()
+        for subscribers in self.get_subscriber_batches(contact_type):
+            yield subscribers.get_recipients(contact_type)
+
+    def enqueue_notifications(self, announcements: 'AnnouncementCollection') -> None:
+        """Queue the messages of the announcements for the subscribers of every notification channel"""
+        from notification import EmailMessageFormatter, EmailSubscriberFilter, TexitDigestFormatter, \
+            TexitMessageFormatter, TexitSubscriberFilter
+        from outbox import NotificationOutbox
+
+        if 'textit' in notification_channels:
+            textit_formatter = TexitMessageFormatter()
+            if textit_digest:
+                textit_formatter = TexitDigestFormatter(textit_digest_segments)
+            NotificationOutbox(self.get_database(), 'textit').enqueue(
+                announcements, textit_formatter, self.get_recipient_batches(TexitSubscriberFilter()),
+                textit_batch_size)
+        if 'email' in notification_channels:
+            NotificationOutbox(self.get_database(), 'email').enqueue(
+                announcements, EmailMessageFormatter(), self.get_recipient_batches(EmailSubscriberFilter()),
+                email_batch_size)
+
+    def get_outbox_workers(self) -> list:
+        """Returns a worker per notification channel"""
+        from notification import TextitAgent
+        from outbox import NotificationOutbox, OutboxWorker
+
+        workers = []
+        if 'textit' in notification_channels:
+            textit_outbox = NotificationOutbox(self.get_database(), 'textit', retry_delay=outbox_retry_delay)
+            textit_agent = TextitAgent(self.http_client, textit_batch_size)
+            workers.append(OutboxWorker(textit_outbox, textit_agent, textit_workers))
+        if 'email' in notification_channels:
+            email_outbox = NotificationOutbox(self.get_database(), 'email', retry_delay=outbox_retry_delay)
+            # one worker thread, the email agent sends everything over a single SMTP connection
+            workers.append(OutboxWorker(email_outbox, self.get_email_agent(), 1))
+        return workers
+
+    def deliver_notifications(self) -> None:
+        """
+        Deliver the queued notifications of all channels at the same time
+
+        Leaves the outbox pending file behind while notifications are left undelivered, e.g. until their retry delay
+        has passed, so a later run whose pages have not changed knows it still has to deliver. The first exception of
+        a channel is raised once every channel is done.
+        """
+        from notification import FanOutNotifier
+
+        self.set_outbox_pending(True)
+        workers = self.get_outbox_workers()
+        notifier = FanOutNotifier(workers)
+        notifier.notify()
+        if len(notifier.get_failures()) > 0:
+            raise notifier.get_failures()[0]
+        self.set_outbox_pending(any(worker.has_undelivered() for worker in workers))
+
+    @staticmethod
+    def is_outbox_pending() -> bool:
+        return os.path.exists(outbox_pending_file)
+
+    @staticmethod
+    def set_outbox_pending(pending: bool) -> None:
+        if pending:
+            open(outbox_pending_file, 'w').close()
+        elif os.path.exists(outbox_pending_file):
+            os.remove(outbox_pending_file)
+
+    def get_recent_announcements(self) -> 'AnnouncementCollection':
+        from announcement import AnnouncementFactory, AnnouncementMapper
+
+        return AnnouncementMapper(self.get_database()).get_recent_announcements(AnnouncementFactory())
+
+    def run(self) -> Union[None, list]:
+        """
+        Run the pipeline once for every source
 
-scraper = Scraper()
-fetcher = DocumentFetcher()
-datetime_updater = DateTimeUpdater(fetcher, scraper)
-database = db_connection()
-factory = AnnouncementFactory()
+        The sources are polled concurrently, each storing and queueing its own new announcements, then the queued
+        notifications of all sources are delivered. When no page changed they are only delivered if the last delivery
+        left some undelivered, so such a run does not open the database otherwise. A source that fails does not stop
+        the others. Its page is fetched in full on the next run and the first failure is raised once the other sources
+        are done, as is a failure to deliver.
 
-try:
-    stored_collection = AnnouncementMapper(database).get_recent_announcements(factory)
-    subscribers = SubscriberMapper(JsonAdapter('./subscribers.json')).get_all_subscribers(SubscriberFactory())
+        :return: None if no announcement page changed, else a collection of new announcements per changed source
+        """
+        sources = self.get_sources()
+        metrics.increment('sources_polled', len(sources))
+        # the stages of poll_source add up the time of every source, poll_sources is the wall time of all of them
+        with metrics.stage('poll_sources'), \
+                ThreadPoolExecutor(max_workers=min(source_workers, len(sources))) as executor:
+            futures = [(source, executor.submit(self.poll_source, source)) for source in sources]
+        new_collections = []
+        failures = []
+        for source, future in futures:
+            try:
+                new_collection = future.result()
+            except Exception as e:
+                logger.exception('Polling source {} failed'.format(source))
+                self.validator_cache.remove(source.get_url())
+                failures.append(e)
+                continue
+            if new_collection is not None:
+                new_collections.append(new_collection)
 
-    web_page = fetcher.fetch_document(target_url)
-    web_collection = scraper \
-        .set_html_document(web_page) \
-        .extract_html(html_element, target_id_name, target_class_names) \
-        .get_announcements(AnnouncementFactory())
+        if len(new_collections) > 0 or self.is_outbox_pending():
+            try:
+                with metrics.stage('deliver'):
+                    self.deliver_notifications()
+            except Exception as e:
+                logger.exception('Delivering the queued notifications failed')
+                failures.append(e)
+        if len(new_collections) > 0:
+            with metrics.stage('save_caches'):
+                self.save_caches()
+        logger.info('HTTP connection usage: {}'.format(self.http_client.get_stats()))
+        if len(failures) > 0:
+            raise failures[0]
+        if len(new_collections) == 0:
+            logger.info('No announcement page has changed since the last run')
+            return None
+        return new_collections
 
-    comparator = Comparator(web_collection, stored_collection, datetime_updater)
-    comparator.check_for_new_announcements()
-    logger.info('Are there any new announcements? {}'.format(comparator.is_any_announcement_new()))
+    def poll_source(self, source: 'Source') -> Union[None, 'AnnouncementCollection']:
+        """
+        Fetch the announcement page of the source and store and queue its new announcements
+
+        :return: None if the page did not change, else the collection of new announcements of the source
+        """
+        with metrics.stage('fetch_listing'):
+            web_page = self.fetcher.fetch_document_if_modified(source.get_url())
+        if web_page is None:
+            logger.info('Announcement page of {} has not changed since the last run'.format(source))
+            return None
+        metrics.increment('sources_changed')
+
+        from announcement import AnnouncementFactory, AnnouncementMapper, Comparator
+        from scraper import Scraper
+
+        with metrics.stage('parse_listing'):
+            web_collection = Scraper() \
+                .set_html_document(web_page) \
+                .extract_html(source.get_html_element(), source.get_id_name(), source.get_class_names()) \
+                .get_announcements(AnnouncementFactory(source.get_name()))
+
+        mapper = AnnouncementMapper(self.get_database(), source.get_name())
+        with metrics.stage('compare'):
+            comparator = Comparator(web_collection, mapper)
+            comparator.check_for_new_announcements()
+        logger.info('Are there any new announcements on {0}? {1}'.format(source, comparator.is_any_announcement_new()))
 
-    if comparator.is_any_announcement_new():
         new_collection = comparator.get_new_announcements()
-        datetime_updater.update_all_datetime(new_collection)
-        textit_notifier = TextitNotifier(
-            new_collection,
-            TexitMessageFormatter(),
-            subscribers,
-            TexitSubscriberFilter(),
-            TextitAgent()
+        if comparator.is_any_announcement_new():
+            with metrics.stage('update_datetime'):
+                self.get_datetime_updater().update_all_datetime(new_collection)
+            # the announcements and their notifications are stored in one transaction and only announcements this
+            # run inserted are queued, so a crash or a concurrent run never queues an announcement twice
+            with metrics.stage('store'), self.get_database().transaction():
+                new_collection = mapper.save_all(new_collection)
+                if not new_collection.is_empty():
+                    self.enqueue_notifications(new_collection)
+            metrics.increment('announcements_new', new_collection.get_size())
+        return new_collection
+
+    def run_measured(self, profile_run: bool = False) -> Union[None, list]:
+        """
+        Run the pipeline once and write the stage timings and counters of the run, also when the run fails
+
+        :param profile_run: Profile the run with cProfile and tracemalloc
+        """
+        metrics.reset()
+        succeeded = False
+        try:
+            with profile(profile_file, trace_memory=True) if profile_run else nullcontext():
+                new_collections = self.run()
+            succeeded = True
+            return new_collections
+        finally:
+            self.write_metrics(succeeded)
+
+    @staticmethod
+    def write_metrics(succeeded: bool) -> None:
+        try:
+            metrics.write_prometheus_textfile(metrics_textfile, succeeded)
+            metrics.write_json_summary(run_summary_file, succeeded)
+        except OSError:
+            logger.exception('Cannot write the run metrics')
+        logger.info('Run stages: {}'.format(
+            ', '.join('{0} {1:.3f}s'.format(stage, seconds) for stage, seconds in metrics.stages.items())))
+
+    def save_caches(self) -> None:
+        """Persist the caches. Only after a successful run so a failed run is retried with a full fetch"""
+        self.validator_cache.save()
+
+    def close(self) -> None:
+        """Close the connections the pipeline opened"""
+        if self.database is not None:
+            self.database.close()
+        self.http_client.close()
+        if self.email_agent is not None:
+            self.email_agent.close()
+
+    def report_error(self) -> None:
+        from notification import TextitErrorReporter
+
+        etype, value, tb = sys.exc_info()
+        exc_type = traceback.format_exception_only(etype, value)
+        logger.exception(traceback.extract_tb(tb))
+        # print(exc_type[0], end='')  # end specified because new line
+        logger.info(exc_type[0])
+
+        logger.info('reporting termination...')
+        TextitErrorReporter(self.http_client).send(exc_type[0])
+
+
+def run_once(profile_run: bool = False) -> None:
+    pipeline = Pipeline()
+    try:
+        pipeline.run_measured(profile_run)
+    except:
+        pipeline.report_error()
+        logger.info('terminating script')
+        exit(1)
+
+
+def run_backfill(max_pages: int = None) -> None:
+    from announcement import AnnouncementFactory, AnnouncementMapper
+    from backfill import Backfiller
+
+    pipeline = Pipeline()
+    try:
+        for source in pipeline.get_sources():
+            Backfiller(
+                pipeline.fetcher,
+                AnnouncementMapper(pipeline.get_database(), source.get_name()),
+                AnnouncementFactory(source.get_name()),
+                pipeline.get_datetime_updater(),
+                pipeline.get_datetime_updater().rate_limiter,
+                source.get_page_url(),
+                source.get_html_element(),
+                source.get_id_name(),
+                source.get_class_names()
+            ).run(max_pages)
+    except:
+        pipeline.report_error()
+        logger.info('terminating script')
+        exit(1)
+
+
+def import_subscribers() -> None:
+    """Copy the subscribers of the json file to the subscriber table"""
+    from database_lib import JsonAdapter
+    from subscriber import SubscriberFactory, SubscriberMapper
+
+    pipeline = Pipeline()
+    if subscriber_store == 'json':
+        exit('set SUBSCRIBER_STORE to postgres or sqlite to import subscribers')
+    subscribers = SubscriberMapper(JsonAdapter(subscribers_file)).get_all_subscribers(SubscriberFactory())
+    pipeline.get_subscriber_mapper().save_all(subscribers)
+    logger.info('Imported {} subscribers'.format(subscribers.get_size()))
+
+
+def run_delivery_worker() -> None:
+    """Deliver queued notifications until SIGINT or SIGTERM. Any number of workers can run at once"""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    pipeline = Pipeline()
+    while not stop.is_set():
+        try:
+            pipeline.deliver_notifications()
+        except:
+            logger.exception('delivery failed')
+        stop.wait(outbox_poll_interval)
+    pipeline.close()
+    logger.info('delivery worker stopped')
+
+
+def run_daemon(profile_run: bool = False) -> None:
+    """
+    Poll the announcement page until SIGINT or SIGTERM, waiting as long as the scheduler decides between polls
+
+    :param profile_run: Profile the first poll
+    """
+    from parsing import LOCAL_TIMEZONE
+    from scheduler import AdaptivePollingScheduler
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    pipeline = Pipeline()
+    if subscriber_store == 'json':
+        pipeline.get_subscribers()
+    scheduler = AdaptivePollingScheduler(LOCAL_TIMEZONE)
+    try:
+        scheduler.observe_published_datetimes(
+            [a.get_published_datetime() for a in pipeline.get_recent_announcements().get_collection_list()]
         )
-        textit_notifier.notify()
-        result = AnnouncementMapper(database).save_all(new_collection)
-
-except:
-    etype, value, tb = sys.exc_info()
-    exc_type = traceback.format_exception_only(etype, value)
-    logger.exception(traceback.extract_tb(tb))
-    # print(exc_type[0], end='')  # end specified because new line
-    logger.info(exc_type[0])
-
-    logger.info('reporting termination...')
-    TextitErrorReporter().send(exc_type[0])
-    logger.info('terminating script')
-    exit(1)
+    except Exception:
+        # the daemon still polls, the scheduler learns the posting hours from the announcements it finds instead
+        logger.exception('Cannot read the recent announcements, polling without their posting hours')
+
+    while not stop.is_set():
+        try:
+            profile_this_run, profile_run = profile_run, False
+            new_collections = pipeline.run_measured(profile_this_run)
+            published_datetimes = [a.get_published_datetime() for new_collection in new_collections or []
+                                   for a in new_collection.get_collection_list()]
+            if len(published_datetimes) == 0:
+                scheduler.record_quiet()
+            else:
+                scheduler.record_change(published_datetimes)
+        except:
+            scheduler.record_failure()
+            if scheduler.failed_polls == 1:  # report once per streak of failures, not on every retry
+                pipeline.report_error()
+            else:
+                logger.exception('poll failed {} times in a row'.format(scheduler.failed_polls))
+        interval = scheduler.get_next_interval()
+        logger.info('next poll in {:.0f}s'.format(interval))
+        stop.wait(interval)
+    pipeline.close()
+    logger.info('daemon stopped')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Notify subscribers of new announcements posted on bit.lk')
+    parser.add_argument('--daemon', action='store_true', help='keep running and poll on an adaptive schedule')
+    parser.add_argument('--backfill', action='store_true', help='store announcements missing from older pages')
+    parser.add_argument('--max-pages', type=int, default=None, help='last page the backfill walks to')
+    parser.add_argument('--import-subscribers', action='store_true',
+                        help='copy the subscribers of the json file to the subscriber table')
+    parser.add_argument('--deliver', action='store_true', help='keep delivering queued notifications')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile a run (the first poll of the daemon) with cProfile and tracemalloc')
+    args = parser.parse_args()
+    configure_logging(log_file)
+    if args.import_subscribers:
+        import_subscribers()
+    elif args.deliver:
+        run_delivery_worker()
+    elif args.backfill:
+        run_backfill(args.max_pages)
+    elif args.daemon:
+        run_daemon(args.profile)
+    else:
+        run_once(args.profile)
@@ -0,0 +1,112 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Union
+
+import requests
+
+from announcement import AnnouncementCollection, AnnouncementFactory, AnnouncementMapper
+from fetcher import DocumentFetcher, TokenBucketRateLimiter
+from logging_lib import get_worker_initializer
+from scraper import DateTimeUpdater, Scraper
+
+logger = logging.getLogger(__name__)
+
+
+def parse_listing_page(html_element: str, id_attribute: str, class_attributes: str, web_page: bytes) -> list:
+    """
+    Extract the announcement data from an announcement list page
+
+    Runs in a worker process so the titles are converted to str, BeautifulSoup strings keep a reference to the whole
+    parse tree.
+    """
+    announcement_data_list = Scraper() \
+        .set_html_document(web_page) \
+        .extract_html(html_element, id_attribute, class_attributes) \
+        .get_announcement_data_list()
+    for announcement_data in announcement_data_list:
+        announcement_data['title'] = str(announcement_data['title'])
+    return announcement_data_list
+
+
+class Backfiller:
+    """
+    Store the announcements that are missing from the database by walking back through the announcement list pages
+
+    Pages are fetched `window` at a time by a thread pool and parsed by a process pool. The walk stops at the first
+    page whose announcements are all stored already or when the site has no more pages.
+
+    :param page_url: URL of an announcement list page with a {} placeholder for the page number
+    """
+
+    def __init__(self, fetcher: DocumentFetcher, mapper: AnnouncementMapper, factory: AnnouncementFactory,
+                 datetime_updater: DateTimeUpdater, rate_limiter: TokenBucketRateLimiter, page_url: str,
+                 html_element: str, id_attribute: str, class_attributes: str, window: int = 4,
+                 parse_workers: int = None):
+        self.fetcher = fetcher
+        self.mapper = mapper
+        self.factory = factory
+        self.datetime_updater = datetime_updater
+        self.rate_limiter = rate_limiter
+        self.page_url = page_url
+        self.parse_page = partial(parse_listing_page, html_element, id_attribute, class_attributes)
+        self.window = window
+        self.parse_workers = parse_workers
+
+    def fetch_page(self, page_number: int) -> Union[None, bytes]:
+        """Returns the announcement list page or None if the page does not exist"""
+        url = self.page_url.format(page_number)
+        self.rate_limiter.acquire(url)
+        try:
+            return self.fetcher.fetch_document(url)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+
+    def find_missing_announcements(self, max_pages: int = None) -> AnnouncementCollection:
+        missing = AnnouncementCollection()
+        page_number = 1
+        initializer, initargs = get_worker_initializer()
+        with ThreadPoolExecutor(max_workers=self.window) as fetch_pool, \
+                ProcessPoolExecutor(self.parse_workers, initializer=initializer, initargs=initargs) as parse_pool:
+            while max_pages is None or page_number <= max_pages:
+                last_page_number = page_number + self.window - 1
+                if max_pages is not None:
+                    last_page_number = min(last_page_number, max_pages)
+                page_numbers = range(page_number, last_page_number + 1)
+                parse_futures = []
+                for web_page in fetch_pool.map(self.fetch_page, page_numbers):
+                    parse_futures.append(None if web_page is None else parse_pool.submit(self.parse_page, web_page))
+
+                for current_page_number, parse_future in zip(page_numbers, parse_futures):
+                    if parse_future is None:
+                        logger.info('Page {} does not exist. Reached the last page'.format(current_page_number))
+                        return missing
+                    collection = self.factory.get_announcement_collection(parse_future.result())
+                    stored = self.mapper.get_existing_check_strings(list(collection))
+                    new_announcements = [collection.get(key) for key in collection if key not in stored]
+                    logger.info('Page {0} has {1} announcements that are not stored'.format(
+                        current_page_number, len(new_announcements)))
+                    if len(new_announcements) == 0:
+                        return missing
+                    for announcement in new_announcements:
+                        missing.add_to_collection(announcement)
+                page_number = last_page_number + 1
+        return missing
+
+    def run(self, max_pages: int = None, update_datetime: bool = True) -> AnnouncementCollection:
+        """
+        Find and store the missing announcements
+
+        :param max_pages: Do not walk past this page number
+        :param update_datetime: Fetch the published and updated datetime of each missing announcement from its page
+        :return: The collection of announcements that were inserted
+        """
+        missing = self.find_missing_announcements(max_pages)
+        logger.info('Found {} announcements that are not stored'.format(missing.get_size()))
+        if missing.is_empty():
+            return missing
+        if update_datetime:
+            self.datetime_updater.update_all_datetime(missing)
+        return self.mapper.save_all(missing)
@@ -32,7 +32,8 @@ CREATE TABLE public.announcement (
     published_datetime timestamp without time zone NOT NULL,
     retrieved_datetime timestamp without time zone NOT NULL,
     stored_timestamp timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL,
-    updated_datetime timestamp without time zone NOT NULL
+    updated_datetime timestamp without time zone NOT NULL,
+    source character varying(255) DEFAULT 'bit.lk'::character varying NOT NULL
 );
 
 
@@ -68,19 +69,26 @@ ALTER TABLE ONLY public.announcement ALTER COLUMN id SET DEFAULT nextval('public
 
 
 --
--- Name: announcement announcement_check_string_key; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+-- Name: announcement announcement_pkey; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
 --
 
 ALTER TABLE ONLY public.announcement
-    ADD CONSTRAINT announcement_check_string_key UNIQUE (check_string);
+    ADD CONSTRAINT announcement_pkey PRIMARY KEY (id);
 
 
 --
--- Name: announcement announcement_pkey; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+-- Name: announcement announcement_source_check_string_key; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
 --
 
 ALTER TABLE ONLY public.announcement
-    ADD CONSTRAINT announcement_pkey PRIMARY KEY (id);
+    ADD CONSTRAINT announcement_source_check_string_key UNIQUE (source, check_string);
+
+
+--
+-- Name: announcement_published_datetime_idx; Type: INDEX; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE INDEX announcement_published_datetime_idx ON public.announcement USING btree (published_datetime DESC);
 
 
 --
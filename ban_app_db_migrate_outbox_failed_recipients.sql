@@ -0,0 +1,9 @@
+--
+-- Migrate a notification outbox created before refused recipients were recorded
+--
+--     psql -d ban_app_db -f ban_app_db_migrate_outbox_failed_recipients.sql
+--
+-- Adds the recipients a server refused permanently, which are not sent the message again.
+--
+
+ALTER TABLE public.notification_outbox ADD COLUMN failed_recipients text[] DEFAULT '{}'::text[] NOT NULL;
@@ -0,0 +1,30 @@
+--
+-- Migrate a database created before announcement sources were added
+--
+--     psql -d ban_app_db -f ban_app_db_migrate_sources.sql
+--
+-- Stores the existing announcements and queued notifications as announcements of bit.lk and makes the source part of
+-- their keys, so the same title on two sources is two announcements. Run it once, with the notifier stopped.
+--
+
+BEGIN;
+
+ALTER TABLE public.announcement ADD COLUMN source character varying(255) DEFAULT 'bit.lk'::character varying NOT NULL;
+
+ALTER TABLE public.notification_outbox ADD COLUMN source character varying(255) DEFAULT 'bit.lk'::character varying NOT NULL;
+
+-- the outbox keys reference the announcement key without a source, drop them before it
+ALTER TABLE ONLY public.notification_outbox
+    ALTER COLUMN source DROP DEFAULT,
+    DROP CONSTRAINT notification_outbox_check_string_fkey,
+    DROP CONSTRAINT notification_outbox_check_string_channel_batch_number_key;
+
+ALTER TABLE ONLY public.announcement
+    DROP CONSTRAINT announcement_check_string_key,
+    ADD CONSTRAINT announcement_source_check_string_key UNIQUE (source, check_string);
+
+ALTER TABLE ONLY public.notification_outbox
+    ADD CONSTRAINT notification_outbox_source_check_string_channel_batch_key UNIQUE (source, check_string, channel, batch_number),
+    ADD CONSTRAINT notification_outbox_source_check_string_fkey FOREIGN KEY (source, check_string) REFERENCES public.announcement(source, check_string);
+
+COMMIT;
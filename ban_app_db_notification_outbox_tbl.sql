@@ -0,0 +1,112 @@
+--
+-- PostgreSQL database dump
+--
+
+-- Dumped from database version 12.4
+-- Dumped by pg_dump version 12.4
+
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+SET default_table_access_method = heap;
+
+--
+-- Name: notification_outbox; Type: TABLE; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE TABLE public.notification_outbox (
+    id integer NOT NULL,
+    source character varying(255) NOT NULL,
+    check_string character varying(255) NOT NULL,
+    channel character varying(16) NOT NULL,
+    batch_number integer NOT NULL,
+    message text NOT NULL,
+    recipients text[] NOT NULL,
+    status character varying(16) DEFAULT 'pending'::character varying NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    claimed_by character varying(255),
+    claimed_at timestamp with time zone,
+    available_at timestamp with time zone DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    sent_at timestamp with time zone,
+    last_response text,
+    failed_recipients text[] DEFAULT '{}'::text[] NOT NULL,
+    created_at timestamp with time zone DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+
+ALTER TABLE public.notification_outbox OWNER TO ban_app_user_01;
+
+--
+-- Name: notification_outbox_id_seq; Type: SEQUENCE; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE SEQUENCE public.notification_outbox_id_seq
+    AS integer
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+ALTER TABLE public.notification_outbox_id_seq OWNER TO ban_app_user_01;
+
+--
+-- Name: notification_outbox_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER SEQUENCE public.notification_outbox_id_seq OWNED BY public.notification_outbox.id;
+
+
+--
+-- Name: notification_outbox id; Type: DEFAULT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.notification_outbox ALTER COLUMN id SET DEFAULT nextval('public.notification_outbox_id_seq'::regclass);
+
+
+--
+-- Name: notification_outbox notification_outbox_pkey; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.notification_outbox
+    ADD CONSTRAINT notification_outbox_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: notification_outbox notification_outbox_source_check_string_channel_batch_key; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.notification_outbox
+    ADD CONSTRAINT notification_outbox_source_check_string_channel_batch_key UNIQUE (source, check_string, channel, batch_number);
+
+
+--
+-- Name: notification_outbox_due_idx; Type: INDEX; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE INDEX notification_outbox_due_idx ON public.notification_outbox USING btree (channel, id) WHERE ((status)::text = ANY ((ARRAY['pending'::character varying, 'sending'::character varying])::text[]));
+
+
+--
+-- Name: notification_outbox notification_outbox_source_check_string_fkey; Type: FK CONSTRAINT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.notification_outbox
+    ADD CONSTRAINT notification_outbox_source_check_string_fkey FOREIGN KEY (source, check_string) REFERENCES public.announcement(source, check_string);
+
+
+--
+-- PostgreSQL database dump complete
+--
+
@@ -0,0 +1,94 @@
+--
+-- PostgreSQL database dump
+--
+
+-- Dumped from database version 12.4
+-- Dumped by pg_dump version 12.4
+
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+SET default_table_access_method = heap;
+
+--
+-- Name: subscriber; Type: TABLE; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE TABLE public.subscriber (
+    id integer NOT NULL,
+    name character varying(255) NOT NULL,
+    contact character varying(255) NOT NULL,
+    contact_type character varying(16) NOT NULL,
+    status character varying(16) NOT NULL,
+    date_created timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+
+ALTER TABLE public.subscriber OWNER TO ban_app_user_01;
+
+--
+-- Name: subscriber_id_seq; Type: SEQUENCE; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE SEQUENCE public.subscriber_id_seq
+    AS integer
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+ALTER TABLE public.subscriber_id_seq OWNER TO ban_app_user_01;
+
+--
+-- Name: subscriber_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER SEQUENCE public.subscriber_id_seq OWNED BY public.subscriber.id;
+
+
+--
+-- Name: subscriber id; Type: DEFAULT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.subscriber ALTER COLUMN id SET DEFAULT nextval('public.subscriber_id_seq'::regclass);
+
+
+--
+-- Name: subscriber subscriber_contact_key; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.subscriber
+    ADD CONSTRAINT subscriber_contact_key UNIQUE (contact);
+
+
+--
+-- Name: subscriber subscriber_pkey; Type: CONSTRAINT; Schema: public; Owner: ban_app_user_01
+--
+
+ALTER TABLE ONLY public.subscriber
+    ADD CONSTRAINT subscriber_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: subscriber_status_contact_type_idx; Type: INDEX; Schema: public; Owner: ban_app_user_01
+--
+
+CREATE INDEX subscriber_status_contact_type_idx ON public.subscriber USING btree (status, contact_type, id);
+
+
+--
+-- PostgreSQL database dump complete
+--
+
@@ -0,0 +1,97 @@
+"""
+Compare the memory and construction time per Announcement object with the previous Announcement class
+
+    python benchmarks/bench_announcement_model.py [count]
+
+The previous class is kept below as it was in announcement.py. Its log calls go to a logger without handlers here,
+the file and console writes it made in the app are not included so the difference is understated.
+"""
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from datetime import timezone as python_timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from announcement import Announcement  # noqa: E402
+
+previous_logger = logging.getLogger('previous_announcement')
+previous_logger.addHandler(logging.NullHandler())
+previous_logger.propagate = False
+previous_logger.setLevel(logging.INFO)
+
+
+class PreviousAnnouncement:
+    def __init__(self, post_id, title, url, published_datetime, updated_datetime, retrieved_datetime, stored_timestamp,
+                 check_string):
+        self.id = post_id
+        self.title = title
+        self.url = url
+        self.published_datetime = published_datetime
+        self.updated_datetime = updated_datetime
+        self.retrieved_datetime = retrieved_datetime
+        self.stored_timestamp = stored_timestamp
+        if not check_string:
+            self.check_string = self.generate_check_string()
+        else:
+            self.check_string = check_string
+
+    def generate_check_string(self) -> str:
+        previous_logger.info('Generating check string')
+        title_lowercase = self.get_title().lower()
+        title_alphanum_no_space = re.sub(r'[^A-Za-z0-9]', "", title_lowercase)
+        date_num = self.get_published_datetime().strftime('%d%m%Y')
+        return title_alphanum_no_space + date_num
+
+    def get_title(self) -> str:
+        return self.title
+
+    def get_published_datetime(self) -> datetime:
+        if self.published_datetime.strftime('%H%M%S') == '000000':
+            previous_logger.info('getting only published date')
+        else:
+            previous_logger.info('getting published date and time')
+        return self.published_datetime
+
+
+def make_arguments(count: int) -> list:
+    start = datetime(2020, 8, 14, tzinfo=python_timezone.utc)
+    retrieved = datetime.now()
+    return [
+        (None, 'Examination Time Table - BIT Semester {} Examination 2020'.format(i),
+         'http://bit.lk/index.php/2020/08/14/post-{}/'.format(i), start - timedelta(days=i // 3), None, retrieved,
+         None, None)
+        for i in range(count)
+    ]
+
+
+def measure(announcement_class, arguments: list) -> tuple:
+    start = time.perf_counter()
+    objects = [announcement_class(*a) for a in arguments]
+    elapsed = time.perf_counter() - start
+    del objects
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [announcement_class(*a) for a in arguments]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return elapsed, size
+
+
+def main(count: int) -> None:
+    logging.disable(logging.INFO)  # the announcement module logs a summary line per collection only
+    arguments = make_arguments(count)
+    print('{:<22} {:>14} {:>16}'.format('class', 'us/object', 'bytes/object'))
+    for announcement_class in (PreviousAnnouncement, Announcement):
+        elapsed, size = measure(announcement_class, arguments)
+        print('{:<22} {:>14.2f} {:>16.0f}'.format(announcement_class.__name__, elapsed / count * 1e6, size / count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
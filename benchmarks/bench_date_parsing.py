@@ -0,0 +1,83 @@
+"""
+Compare the per announcement date and datetime parse cost of the parsing module with the previous implementation
+
+    python benchmarks/bench_date_parsing.py [iterations]
+
+An announcement costs one listing date parse plus two ISO8601 parses (published and updated datetime). The previous
+implementation is kept below as it was in scraper.py, it needs the iso8601 package which the app no longer uses. It
+is skipped when iso8601 is not installed.
+"""
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+from datetime import timezone as python_timezone
+
+from pytz import timezone
+
+try:
+    import iso8601
+except ImportError:  # only the previous implementation uses it
+    iso8601 = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parsing import parse_iso8601, parse_listing_date  # noqa: E402
+
+LISTING_DATE = 'August 14th, 2020 by '
+PUBLISHED = '2020-08-14T10:31:52+05:30'
+UPDATED = '2020-08-15T08:12:07+05:30'
+
+
+def previous_get_date_from_string(date_string: str) -> datetime:
+    regex = r'^(January|February|March?|April|May|June|July|August|September|October|November|December)' \
+            r' (\d{1,2})(st|nd|rd|th), (\d{4}) by $'
+    if re.match(regex, date_string) is None:
+        raise ValueError(date_string)
+    date_list = date_string.split(' ')
+    if len(date_list[1]) == 5:
+        date_list[1] = date_list[1][0:2]
+    else:
+        date_list[1] = date_list[1][0:1].zfill(1)
+    new_date_string = ' '.join(date_list[0:3])
+    date = datetime.strptime(new_date_string, '%B %d %Y')
+    return date.replace(tzinfo=python_timezone.utc)
+
+
+def previous_get_datetime_from_string(datetime_string: str) -> datetime:
+    regex = r'^(\d{4})-(\d{2})-(\d{2})T(\d{2})\:(\d{2})\:(\d{2})[+-](\d{2})\:(\d{2})$'
+    if re.match(regex, datetime_string) is None:
+        raise ValueError(datetime_string)
+    return iso8601.parse_date(datetime_string).astimezone(timezone('Asia/Colombo'))
+
+
+def previous_announcement() -> None:
+    previous_get_date_from_string(LISTING_DATE)
+    previous_get_datetime_from_string(PUBLISHED)
+    previous_get_datetime_from_string(UPDATED)
+
+
+def current_announcement() -> None:
+    parse_listing_date(LISTING_DATE)
+    parse_iso8601(PUBLISHED)
+    parse_iso8601(UPDATED)
+
+
+def main(iterations: int) -> None:
+    implementations = [('parsing', current_announcement)]
+    if iso8601 is None:
+        print('skipping previous: it requires the iso8601 package')
+    else:
+        assert previous_get_date_from_string(LISTING_DATE) == parse_listing_date(LISTING_DATE)
+        assert previous_get_datetime_from_string(PUBLISHED) == parse_iso8601(PUBLISHED)
+        implementations.insert(0, ('previous', previous_announcement))
+
+    print('{:<14} {:>16}'.format('implementation', 'us/announcement'))
+    for name, function in implementations:
+        best = min(timeit.repeat(function, number=iterations, repeat=5)) / iterations
+        print('{:<14} {:>16.2f}'.format(name, best * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
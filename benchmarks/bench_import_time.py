@@ -0,0 +1,56 @@
+"""
+Show what the start up of the app spends its time importing and check the heavy modules are not imported
+
+    python benchmarks/bench_import_time.py [top]
+
+Imports app in a fresh interpreter with -X importtime and lists the `top` modules by cumulative import time. Exits
+with an error if a module that should only be imported by a later stage of a run was imported at start up. The
+start up time is also tracked over commits by run_suite.py as startup.import_app.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# imported by the stages after the listing page is fetched, a run whose page did not change never needs them
+DEFERRED_MODULES = ('bs4', 'psycopg2', 'pytz', 'announcement', 'database_lib', 'notification', 'outbox', 'scraper',
+                    'subscriber', 'backfill')
+
+
+def get_import_times() -> list:
+    """Returns (cumulative microseconds, self microseconds, module) of every module imported by `import app`"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        times.append((int(cumulative), int(self_time), module.strip()))
+    return times
+
+
+def get_imported_modules() -> set:
+    completed = subprocess.run([sys.executable, '-c', 'import sys, app; print("\\n".join(sys.modules))'], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    return set(completed.stdout.split())
+
+
+def main(top: int) -> None:
+    times = get_import_times()
+    total = max(times)[0]
+    print('import app: {0:.1f} ms, {1} modules'.format(total / 1000, len(times)))
+    print('{:>14} {:>10}  {}'.format('cumulative ms', 'self ms', 'module'))
+    for cumulative, self_time, module in sorted(times, reverse=True)[:top]:
+        print('{:>14.1f} {:>10.1f}  {}'.format(cumulative / 1000, self_time / 1000, module))
+
+    imported = get_imported_modules()
+    deferred = [module for module in DEFERRED_MODULES if module in imported]
+    if deferred:
+        sys.exit('imported at start up: {}'.format(', '.join(deferred)))
+    print('none of {} imported at start up'.format(', '.join(DEFERRED_MODULES)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
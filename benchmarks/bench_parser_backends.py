@@ -0,0 +1,80 @@
+"""
+Compare the parse time and peak memory of the Scraper parser backends on saved bit.lk pages
+
+    python benchmarks/bench_parser_backends.py [iterations]
+
+Peak memory is measured with tracemalloc which only sees allocations made through python's allocator. The libxml2
+tree built by lxml is allocated outside of it and is not included.
+"""
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parser_backend import BeautifulSoupBackend, LxmlBackend, SelectolaxBackend  # noqa: E402
+from scraper import Scraper  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture:
+        return fixture.read()
+
+
+def parse_listing(backend, web_page: bytes) -> None:
+    Scraper(backend) \
+        .set_html_document(web_page) \
+        .extract_html('article', 'post-6', 'post-6 page type-page status-publish hentry') \
+        .get_announcement_data_list()
+
+
+def parse_detail(backend, web_page: bytes) -> None:
+    scraper = Scraper(backend).set_html_document(web_page)
+    scraper.extract_html('time', None, 'published').get_datetime()
+    scraper.extract_html('time', None, 'updated').get_datetime()
+
+
+def measure(function, backend, web_page: bytes, iterations: int) -> tuple:
+    function(backend, web_page)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(backend, web_page)
+    elapsed = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    function(backend, web_page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def get_backends() -> list:
+    backends = [BeautifulSoupBackend()]
+    for backend_class in (LxmlBackend, SelectolaxBackend):
+        try:
+            backends.append(backend_class())
+        except ImportError as e:
+            print('skipping {0}: {1}'.format(backend_class.__name__, e))
+    return backends
+
+
+def main(iterations: int) -> None:
+    logging.disable(logging.INFO)  # keep the per announcement log lines out of the timing
+    pages = [
+        ('listing page', parse_listing, read_fixture('listing_page.html')),
+        ('detail page', parse_detail, read_fixture('detail_page.html')),
+    ]
+    print('{:<22} {:<14} {:>12} {:>14}'.format('backend', 'page', 'ms/parse', 'peak KiB'))
+    for backend in get_backends():
+        for page_name, function, web_page in pages:
+            elapsed, peak = measure(function, backend, web_page, iterations)
+            print('{:<22} {:<14} {:>12.3f} {:>14.1f}'.format(
+                type(backend).__name__, page_name, elapsed * 1000, peak / 1024))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
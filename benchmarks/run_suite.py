@@ -0,0 +1,231 @@
+"""
+Run the component benchmarks and compare them with the results stored for the previous commit
+
+    python benchmarks/run_suite.py [--filter NAME] [--rounds 5] [--threshold 1.2] [--fail-on-regression]
+
+Every run is appended to benchmarks/results/history.jsonl with the commit it ran on. A benchmark that is slower than
+`threshold` times its result on the most recent other commit is reported as a regression. Results are only
+comparable between runs on the same machine, so the history is not checked in.
+
+The listing and detail pages are the saved pages in benchmarks/fixtures. Collections and subscriber files of the
+larger sizes are generated. startup.import_app is the time a fresh interpreter takes to import the app, what a cron
+run pays before it fetches anything.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as python_timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from announcement import AnnouncementFactory, CheckStringIndexInterface, Comparator  # noqa: E402
+from database_lib import JsonAdapter  # noqa: E402
+from notification import TexitDigestFormatter, TexitMessageFormatter  # noqa: E402
+from scraper import Scraper, TimeElementExtractor  # noqa: E402
+from subscriber import SubscriberFactory, SubscriberMapper  # noqa: E402
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+FIXTURES = os.path.join(BENCHMARKS, 'fixtures')
+HISTORY_FILE = os.path.join(BENCHMARKS, 'results', 'history.jsonl')
+COLLECTION_SIZES = (10, 1000, 100000)
+SUBSCRIBER_FILE_SIZES = (1000, 100000)
+
+
+class SetIndex(CheckStringIndexInterface):
+    """Stored check strings held in memory in place of the announcement table"""
+
+    def __init__(self, check_strings: set):
+        self.check_strings = check_strings
+
+    def get_existing_check_strings(self, check_strings: list) -> set:
+        return {check_string for check_string in check_strings if check_string in self.check_strings}
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture:
+        return fixture.read()
+
+
+def make_announcement_data(count: int) -> list:
+    published = datetime(2020, 8, 14, tzinfo=python_timezone.utc)
+    retrieved = datetime.now()
+    return [
+        {
+            'id': None,
+            'title': 'Examination Time Table - BIT Semester {} Examination 2020'.format(i),
+            'url': 'http://bit.lk/index.php/2020/08/14/post-{}/'.format(i),
+            'check_string': None,
+            'published_datetime': published - timedelta(days=i // 3),
+            'updated_datetime': None,
+            'retrieved_datetime': retrieved,
+            'stored_timestamp': None,
+        }
+        for i in range(count)
+    ]
+
+
+def write_subscriber_file(directory: str, count: int) -> str:
+    subscriber_file = os.path.join(directory, 'subscribers_{}.json'.format(count))
+    subscribers = [
+        {
+            'name': 'subscriber {}'.format(i),
+            'contact': 94770000000 + i if i % 4 else 'subscriber{}@example.com'.format(i),
+            'status': 'active',
+        }
+        for i in range(count)
+    ]
+    with open(subscriber_file, 'w') as subscriber_data:
+        json.dump(subscribers, subscriber_data)
+    return subscriber_file
+
+
+def get_benchmarks(directory: str) -> list:
+    """Returns (name, function) pairs. Each function runs the measured code once"""
+    listing_page = read_fixture('listing_page.html')
+    detail_page = read_fixture('detail_page.html')
+
+    def scrape_listing():
+        Scraper() \
+            .set_html_document(listing_page) \
+            .extract_html('article', 'post-6', 'post-6 page type-page status-publish hentry') \
+            .get_announcements(AnnouncementFactory())
+
+    def parse_detail_datetime():  # what DateTimeUpdater.fetch_datetime does with a downloaded page
+        extractor = TimeElementExtractor(('published', 'updated'))
+        for i in range(0, len(detail_page), 8192):
+            if extractor.feed_bytes(detail_page[i:i + 8192]):
+                break
+        extractor.get_datetime_list()
+
+    def import_app():
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, check=True)
+
+    benchmarks = [
+        ('startup.import_app', import_app),
+        ('scraper.listing_page', scrape_listing),
+        ('datetime_updater.detail_page', parse_detail_datetime),
+    ]
+
+    for size in COLLECTION_SIZES:
+        data = make_announcement_data(size)
+        collection = AnnouncementFactory().get_announcement_collection(data)
+        index = SetIndex(set(list(collection)[::2]))  # every second announcement is stored
+        benchmarks.append(('announcement_factory.{}'.format(size),
+                           lambda data=data: AnnouncementFactory().get_announcement_collection(data)))
+        benchmarks.append(('comparator.{}'.format(size),
+                           lambda c=collection, i=index: Comparator(c, i).check_for_new_announcements()))
+
+    announcements = AnnouncementFactory().get_announcement_collection(make_announcement_data(1000))
+    benchmarks.append(('texit_message_formatter.1000', lambda: announcements.format(TexitMessageFormatter())))
+    benchmarks.append(('texit_digest_formatter.1000', lambda: announcements.format(TexitDigestFormatter())))
+
+    for size in SUBSCRIBER_FILE_SIZES:
+        subscriber_file = write_subscriber_file(directory, size)
+        benchmarks.append((
+            'subscriber_mapper.json_{}'.format(size),
+            lambda f=subscriber_file: SubscriberMapper(JsonAdapter(f)).get_all_subscribers(SubscriberFactory())
+        ))
+    return benchmarks
+
+
+def measure(function, rounds: int, min_round_time: float = 0.2) -> dict:
+    """Returns the per call times of `rounds` rounds, each calling the function for at least min_round_time seconds"""
+    function()  # warm up
+    start = time.perf_counter()
+    function()
+    number = max(1, int(min_round_time / max(time.perf_counter() - start, 1e-9)))
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times), 'median': statistics.median(times), 'calls_per_round': number, 'rounds': rounds}
+
+
+def get_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARKS,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if status else '')
+
+
+def load_previous_run(commit: str) -> dict:
+    """Returns the most recent stored run of another commit or an empty dict"""
+    if not os.path.exists(HISTORY_FILE):
+        return {}
+    previous = {}
+    with open(HISTORY_FILE) as history:
+        for line in history:
+            run = json.loads(line)
+            if run['commit'] != commit:
+                previous = run
+    return previous
+
+
+def save_run(run: dict) -> None:
+    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+    with open(HISTORY_FILE, 'a') as history:
+        history.write(json.dumps(run) + '\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--no-save', action='store_true', help='do not append this run to the history')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # the factory logs a line per collection
+    commit = get_commit()
+    previous = load_previous_run(commit)
+    previous_results = previous.get('results', {})
+    results = {}
+    regressions = []
+    print('{:<36} {:>14} {:>14} {:>8}'.format('benchmark', 'median ms', 'previous ms', 'ratio'))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, function in get_benchmarks(directory):
+            if args.filter not in name:
+                continue
+            results[name] = measure(function, args.rounds)
+            median = results[name]['median']
+            line = '{:<36} {:>14.4f}'.format(name, median * 1000)
+            if name in previous_results:
+                ratio = median / previous_results[name]['median']
+                line += ' {:>14.4f} {:>8.2f}'.format(previous_results[name]['median'] * 1000, ratio)
+                if ratio > args.threshold:
+                    regressions.append(name)
+                    line += '  REGRESSION'
+            print(line)
+
+    if previous:
+        print('compared with {0} ({1})'.format(previous['commit'], previous['date']))
+    if not args.no_save:
+        save_run({
+            'commit': commit,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'results': results,
+        })
+    if regressions and args.fail_on_regression:
+        sys.exit('{} benchmarks regressed: {}'.format(len(regressions), ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+
+class JsonFileCache:
+    """
+    A dictionary of cache entries persisted in a json file
+
+    Changes are kept in memory until save() is called so a run that fails midway does not persist them.
+    """
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as cache_data:
+                self.entries = json.load(cache_data)
+        except (OSError, ValueError):
+            logger.exception('Cannot read cache file {}. Starting with an empty cache'.format(self.cache_file))
+            self.entries = {}
+
+    def save(self) -> None:
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'w') as cache_data:
+            json.dump(self.entries, cache_data)
+        os.replace(temp_file, self.cache_file)  # atomic so a crash never leaves a half written cache
+
+    def get(self, key: str) -> Union[None, dict]:
+        return self.entries.get(key)
+
+    def set(self, key: str, entry: dict) -> None:
+        self.entries[key] = entry
+
+    def remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+
+class ValidatorCache(JsonFileCache):
+    """
+    Cache of the HTTP validators (ETag and Last-Modified) and a digest of the body of fetched web pages keyed by URL
+
+    The digest catches unchanged pages from servers that do not send validators or ignore conditional requests.
+    """
+
+    def get_request_headers(self, url: str) -> dict:
+        """Returns the conditional request headers for the url. Empty if the url was never fetched"""
+        entry = self.get(url)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_content_unchanged(self, url: str, content: bytes) -> bool:
+        entry = self.get(url)
+        return entry is not None and entry.get('digest') == self.get_digest(content)
+
+    def update(self, url: str, response_headers: dict, content: bytes) -> None:
+        self.set(url, {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'digest': self.get_digest(content),
+        })
+
+    @staticmethod
+    def get_digest(content: bytes) -> str:
+        return hashlib.sha1(content).hexdigest()
+
@@ -1,44 +1,381 @@
 import os
 import logging
 import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Union
+
 import psycopg2
 import psycopg2.extensions
-from dotenv import load_dotenv, find_dotenv
-
-load_dotenv(find_dotenv(), override=True)
+import psycopg2.extras
+import psycopg2.pool
+from env_lib import load_environment
+from parsing import get_contact_type
+from metrics import metrics
 
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-file_handler = logging.FileHandler('app.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+class DatabaseConnectionError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+def get_connection_parameters() -> dict:
+    """Returns the connection parameters set by the HOST, DATABASE, USER and PASSWORD environment variables"""
+    load_environment()
+    return {
+        'host': os.environ.get('HOST'),
+        'database': os.environ.get('DATABASE'),
+        'user': os.environ.get('USER'),
+        'password': os.environ.get('PASSWORD'),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_counting_cursor_class(cursor_class: type) -> type:
+    """Returns a subclass of the cursor class that counts the statements it sends in the database_statements counter"""
+
+    class CountingCursor(cursor_class):
+        def execute(self, query, vars=None):
+            metrics.increment('database_statements')
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            metrics.increment('database_statements', len(vars_list))  # psycopg2 executes once per parameter set
+            return super().executemany(query, vars_list)
+
+        def fetchmany(self, size=None):
+            if self.name is not None:  # a server side cursor fetches every batch with a FETCH statement
+                metrics.increment('database_statements')
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+
+    CountingCursor.__name__ = 'Counting' + cursor_class.__name__
+    return CountingCursor
+
+
+class StatementCountingConnection(psycopg2.extensions.connection):
+    """A connection whose cursors, of any cursor factory, count the statements they send"""
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = get_counting_cursor_class(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections that is only created when a connection is first needed
 
-HOST = os.environ.get('HOST')
-DATABASE = os.environ.get('DATABASE')
-USER = os.environ.get('USER')
-PASSWORD = os.environ.get('PASSWORD')
+    Connections idle for longer than `health_check_interval` seconds are checked before they are handed out and
+    replaced if they are broken. A connection that fails during a transaction is discarded so the next transaction
+    reconnects.
 
+    :param maxconn: Maximum number of open connections. Callers wait for a free connection when all are in use
+    """
 
-def db_connection() -> psycopg2.extensions.connection:
-    try:
-        logger.info('Connecting to {0} with user {1}'.format(DATABASE, USER))
-        con = psycopg2.connect(host=HOST, database=DATABASE, user=USER, password=PASSWORD)
-        return con
-    except psycopg2.Error as e:
-        logger.exception(e)
-        exit("cannot connect to database")
+    def __init__(self, minconn: int = 1, maxconn: int = 4, health_check_interval: float = 30.0):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.pool = None
+        self.last_used = {}  # id of connection -> time it was returned to the pool
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(maxconn)
+        self.local = threading.local()
 
+    def get_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        with self.lock:
+            if self.pool is None:
+                parameters = get_connection_parameters()
+                try:
+                    logger.info('Connecting to {0} with user {1}'.format(parameters['database'], parameters['user']))
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, connection_factory=StatementCountingConnection, **parameters)
+                except psycopg2.Error as e:
+                    logger.exception(e)
+                    raise DatabaseConnectionError('cannot connect to database') from e
+            return self.pool
 
-class JsonAdapter:
+    def get_connection(self) -> psycopg2.extensions.connection:
+        pool = self.get_pool()
+        self.available.acquire()
+        try:
+            for _ in range(self.maxconn + 1):  # every pooled connection may be broken e.g. after a database restart
+                connection = pool.getconn()
+                if self.is_healthy(connection):
+                    return connection
+                logger.info('Discarding broken database connection')
+                self.discard(connection)
+            raise DatabaseConnectionError('cannot get a working database connection')
+        except psycopg2.Error as e:
+            self.available.release()
+            raise DatabaseConnectionError('cannot connect to database') from e
+        except Exception:
+            self.available.release()
+            raise
+
+    def put_connection(self, connection: psycopg2.extensions.connection) -> None:
+        try:
+            if connection.closed:
+                self.discard(connection)
+            else:
+                self.last_used[id(connection)] = time.monotonic()
+                self.get_pool().putconn(connection)
+        finally:
+            self.available.release()
+
+    def discard(self, connection: psycopg2.extensions.connection) -> None:
+        self.last_used.pop(id(connection), None)
+        self.get_pool().putconn(connection, close=True)
+
+    def is_healthy(self, connection: psycopg2.extensions.connection) -> bool:
+        if connection.closed:
+            return False
+        last_used = self.last_used.get(id(connection))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def transaction(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Use a pooled connection for a transaction that is committed on exit or rolled back on an exception
+
+        Nested transactions in the same thread use the outer transaction's connection and are committed with it.
+        """
+        outer_connection = getattr(self.local, 'connection', None)
+        if outer_connection is not None:
+            yield outer_connection
+            return
+
+        connection = self.get_connection()
+        self.local.connection = connection
+        metrics.increment('database_transactions')
+        try:
+            yield connection
+            connection.commit()
+        except psycopg2.OperationalError:
+            logger.exception('Database connection failed during a transaction')
+            connection.close()  # discarded by put_connection so the next transaction reconnects
+            raise
+        except BaseException:
+            if not connection.closed:
+                connection.rollback()
+            raise
+        finally:
+            self.local.connection = None
+            self.put_connection(connection)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+                self.last_used = {}
+
+
+class SubscriberAdapterInterface:
+    def get_all(self) -> list:
+        """Returns every subscriber as a dictionary"""
+        pass
+
+    def iter_batches(self, status: str = 'active', contact_type: str = None, batch_size: int = 1000) -> Iterator[list]:
+        """Yields lists of at most batch_size subscriber dictionaries with the status and contact type"""
+        pass
+
+    def save_all(self, subscriber_list_dict: list) -> None:
+        pass
+
+
+class JsonAdapter(SubscriberAdapterInterface):
     def __init__(self, json_source_file: str):
+        self.json_source_file = json_source_file
         with open(json_source_file) as json_data:
             self.subscribers_list_dict = json.load(json_data)
 
     def get_all(self) -> list:
         return self.subscribers_list_dict
+
+    def iter_batches(self, status: str = 'active', contact_type: str = None, batch_size: int = 1000) -> Iterator[list]:
+        batch = []
+        for subscriber_dict in self.subscribers_list_dict:
+            if subscriber_dict['status'] != status:
+                continue
+            if contact_type is not None and get_contact_type(subscriber_dict['contact']) != contact_type:
+                continue
+            batch.append(subscriber_dict)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def save_all(self, subscriber_list_dict: list) -> None:
+        """Replace the subscribers of the json file"""
+        self.subscribers_list_dict = subscriber_list_dict
+        with open(self.json_source_file, 'w') as json_data:
+            json.dump(subscriber_list_dict, json_data, indent=2, default=str)
+
+
+class SubscriberTableSql:
+    """
+    The statements of the subscriber table shared by the Postgres and SQLite adapters
+
+    `placeholder` is the parameter marker of the database driver.
+    """
+    placeholder = '%s'
+
+    def get_select_sql(self, status: str, contact_type: Union[None, str]) -> tuple:
+        sql = 'SELECT id, name, contact, contact_type, status, date_created FROM subscriber ' \
+              'WHERE status = {}'.format(self.placeholder)
+        parameters = [status]
+        if contact_type is not None:
+            sql += ' AND contact_type = {}'.format(self.placeholder)
+            parameters.append(contact_type)
+        return sql + ' ORDER BY id', parameters
+
+    def get_upsert_sql(self) -> str:
+        return 'INSERT INTO subscriber(name, contact, contact_type, status) VALUES ({0}, {0}, {0}, {0}) ' \
+               'ON CONFLICT (contact) DO UPDATE SET ' \
+               'name = EXCLUDED.name, contact_type = EXCLUDED.contact_type, status = EXCLUDED.status' \
+            .format(self.placeholder)
+
+    @staticmethod
+    def get_upsert_parameters(subscriber_dict: dict) -> tuple:
+        contact = str(subscriber_dict['contact'])
+        return subscriber_dict['name'], contact, get_contact_type(contact), subscriber_dict['status']
+
+    def get_delete_sql(self) -> str:
+        return 'DELETE FROM subscriber WHERE contact = {}'.format(self.placeholder)
+
+
+class SubscriberTableAdapter(SubscriberTableSql, SubscriberAdapterInterface):
+    """
+    Subscribers stored in the subscriber table, indexed on status and contact type
+
+    Subscribers are added and removed one at a time without rewriting the rest. iter_batches() streams the matching
+    subscribers through a server side cursor so only one batch is in memory at a time.
+    """
+
+    def __init__(self, database: ConnectionPool):
+        self.database = database
+
+    def get_all(self) -> list:
+        sql = 'SELECT id, name, contact, contact_type, status, date_created FROM subscriber ORDER BY id'
+        with self.database.transaction() as connection:
+            cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(sql)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def iter_batches(self, status: str = 'active', contact_type: str = None, batch_size: int = 1000) -> Iterator[list]:
+        sql, parameters = self.get_select_sql(status, contact_type)
+        with self.database.transaction() as connection:
+            cursor = connection.cursor(name='subscriber_stream', cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.itersize = batch_size
+            cursor.execute(sql, parameters)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            finally:
+                cursor.close()
+
+    def add(self, subscriber_dict: dict) -> None:
+        """Insert the subscriber or update the subscriber with the same contact"""
+        with self.database.transaction() as connection:
+            connection.cursor().execute(self.get_upsert_sql(), self.get_upsert_parameters(subscriber_dict))
+
+    def remove(self, contact: str) -> None:
+        with self.database.transaction() as connection:
+            connection.cursor().execute(self.get_delete_sql(), (str(contact),))
+
+    def save_all(self, subscriber_list_dict: list) -> None:
+        """Insert or update the subscribers, subscribers that are not in the list are kept"""
+        with self.database.transaction() as connection:
+            psycopg2.extras.execute_batch(
+                connection.cursor(),
+                self.get_upsert_sql(),
+                [self.get_upsert_parameters(subscriber_dict) for subscriber_dict in subscriber_list_dict],
+                page_size=1000
+            )
+
+
+class SqliteSubscriberAdapter(SubscriberTableSql, SubscriberAdapterInterface):
+    """
+    The subscriber table in a local SQLite file, a stand in for the Postgres subscriber table
+
+    The table and indexes are created if they do not exist.
+    """
+    placeholder = '?'
+
+    def __init__(self, sqlite_file: str):
+        self.sqlite_file = sqlite_file
+        with self.transaction() as connection:
+            connection.executescript(
+                'CREATE TABLE IF NOT EXISTS subscriber ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'name TEXT NOT NULL, '
+                'contact TEXT NOT NULL UNIQUE, '
+                'contact_type TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'date_created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP); '
+                'CREATE INDEX IF NOT EXISTS subscriber_status_contact_type_idx ON subscriber (status, contact_type);'
+            )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.sqlite_file)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def get_all(self) -> list:
+        sql = 'SELECT id, name, contact, contact_type, status, date_created FROM subscriber ORDER BY id'
+        with self.transaction() as connection:
+            return [dict(row) for row in connection.execute(sql).fetchall()]
+
+    def iter_batches(self, status: str = 'active', contact_type: str = None, batch_size: int = 1000) -> Iterator[list]:
+        sql, parameters = self.get_select_sql(status, contact_type)
+        with self.transaction() as connection:
+            cursor = connection.execute(sql, parameters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+
+    def save_all(self, subscriber_list_dict: list) -> None:
+        with self.transaction() as connection:
+            connection.executemany(
+                self.get_upsert_sql(),
+                [self.get_upsert_parameters(subscriber_dict) for subscriber_dict in subscriber_list_dict]
+            )
+
+    def add(self, subscriber_dict: dict) -> None:
+        """Insert the subscriber or update the subscriber with the same contact"""
+        with self.transaction() as connection:
+            connection.execute(self.get_upsert_sql(), self.get_upsert_parameters(subscriber_dict))
+
+    def remove(self, contact: str) -> None:
+        with self.transaction() as connection:
+            connection.execute(self.get_delete_sql(), (str(contact),))
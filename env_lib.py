@@ -0,0 +1,15 @@
+"""
+Loading of the .env file
+
+Modules that read settings from the environment call load_environment() before they read them instead of loading the
+file when they are imported. The file is searched for and read once per process.
+"""
+from functools import lru_cache
+
+from dotenv import load_dotenv, find_dotenv
+
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """Load the variables of the nearest .env file into os.environ, overriding variables already set"""
+    load_dotenv(find_dotenv(), override=True)
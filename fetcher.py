@@ -0,0 +1,147 @@
+"""
+Downloading web pages: the rate limiter and the document fetcher
+
+Kept apart from the scraper so a run whose listing page has not changed only imports the HTTP client, not the HTML
+parser, the announcement model or the database driver.
+"""
+import logging
+import threading
+from time import monotonic, sleep
+from typing import Iterator, Union
+from urllib.parse import urlparse
+
+import requests
+
+from cache_lib import ValidatorCache
+from http_lib import HttpClient
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketRateLimiter:
+    """
+    Limit the rate of requests sent to each host using a token bucket per host
+
+    A request to a host takes one token from the host's bucket. Buckets refill at `rate` tokens per second up to
+    `capacity` tokens, so a burst of up to `capacity` requests goes out at once and the rest are spaced out.
+
+    :param rate: Number of tokens added to a bucket per second
+    :param capacity: Maximum number of tokens a bucket holds i.e. the largest allowed burst
+    """
+
+    def __init__(self, rate: float = 2.0, capacity: int = 10):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}  # host -> (tokens, last refill time)
+        self.lock = threading.Lock()
+
+    def acquire(self, url: str) -> None:
+        """Block until a request to the host of the url is allowed"""
+        host = urlparse(url).netloc
+        while True:
+            with self.lock:
+                now = monotonic()
+                tokens, last_refill = self.buckets.get(host, (self.capacity, now))
+                tokens = min(self.capacity, tokens + (now - last_refill) * self.rate)
+                if tokens >= 1:
+                    self.buckets[host] = (tokens - 1, now)
+                    return
+                self.buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            logger.info('rate limit reached for {0}, waiting {1:.2f}s ...'.format(host, wait))
+            sleep(wait)
+
+
+class DocumentFetcher:
+    def __init__(self, validator_cache: ValidatorCache = None, http_client: HttpClient = None):
+        self.html_document = b''
+        self.validator_cache = validator_cache
+        self.http_client = http_client if http_client is not None else HttpClient()
+        self.headers = {
+            'Upgrade-Insecure-Requests': '1',
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/84.0.4147.105 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,'
+                      'application/signed-exchange;v=b3;q=0.9',
+            'Accept-Encoding': 'gzip,deflate',
+            'Accept-Language': 'en-US,en;q=0.9'
+        }
+
+    def fetch_document(self, url: str) -> bytes:
+        """Download the webpage given by the url using the shared http client"""
+        self.html_document = b''
+        try:
+            response = self.http_client.get(url, headers=self.headers)
+            response.raise_for_status()
+            self.html_document = response.content
+            metrics.increment('http_bytes', len(response.content))
+            logger.info('web page {0} fetched with status code: {1}'.format(url, response.status_code))
+            return response.content  # not self.html_document, fetches may run concurrently
+        except requests.exceptions.RequestException:
+            logger.exception('Exception raised in Scraper.fetch_document()')
+            raise
+
+    def fetch_document_if_modified(self, url: str) -> Union[None, bytes]:
+        """
+        Download the webpage given by the url only if it changed since it was last fetched
+
+        Sends If-None-Match/If-Modified-Since headers from the validator cache. Without a validator cache this is
+        the same as fetch_document().
+
+        :param url: URL of the webpage
+        :return: The webpage or None if the server responded 304 Not Modified or the body is the same as last time
+        """
+        if self.validator_cache is None:
+            return self.fetch_document(url)
+        headers = dict(self.headers)
+        headers.update(self.validator_cache.get_request_headers(url))
+        try:
+            response = self.http_client.get(url, headers=headers)
+            if response.status_code == 304:
+                metrics.increment('http_not_modified')
+                logger.info('web page {0} not modified'.format(url))
+                return None
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            logger.exception('Exception raised in Scraper.fetch_document_if_modified()')
+            raise
+        logger.info('web page {0} fetched with status code: {1}'.format(url, response.status_code))
+        metrics.increment('http_bytes', len(response.content))
+        is_unchanged = self.validator_cache.is_content_unchanged(url, response.content)
+        self.validator_cache.update(url, response.headers, response.content)
+        if is_unchanged:
+            metrics.increment('http_not_modified')
+            logger.info('web page {0} content is the same as the last fetch'.format(url))
+            return None
+        self.html_document = response.content
+        return response.content
+
+    def stream_document(self, url: str, chunk_size: int = 8192) -> Iterator[bytes]:
+        """
+        Download the webpage given by the url in chunks
+
+        The download is aborted and the connection closed when the generator is closed before the end of the page.
+        """
+        bytes_read = 0
+        try:
+            with self.http_client.get(url, headers=self.headers, stream=True) as response:
+                response.raise_for_status()
+                logger.info('web page {0} streaming with status code: {1}'.format(url, response.status_code))
+                for chunk in response.iter_content(chunk_size):
+                    bytes_read += len(chunk)
+                    yield chunk
+        except requests.exceptions.RequestException:
+            logger.exception('Exception raised in Scraper.stream_document()')
+            raise
+        finally:
+            metrics.increment('http_bytes', bytes_read)
+            logger.info('read {0} bytes of web page {1}'.format(bytes_read, url))
+
+    def set_headers(self, headers: dict) -> None:
+        """Set the headers the request used to download a webpage"""
+        self.headers = headers
+
+    def set_user_agent(self, user_agent: str) -> None:
+        """Set an alternative user-agent header"""
+        self.headers['User-Agent'] = user_agent
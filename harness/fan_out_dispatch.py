@@ -0,0 +1,90 @@
+"""
+Notify generated SMS and email subscribers of a few announcements through the stub gateway and the SMTP sink
+
+    python harness/fan_out_dispatch.py [--subscribers 2000] [--announcements 3] [--delay 0.02]
+
+Runs the textit and email notifiers one after the other and then through FanOutNotifier, and checks the email agent
+used a single SMTP connection for all messages.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from announcement import Announcement, AnnouncementCollection  # noqa: E402
+from env_lib import load_environment  # noqa: E402
+from harness.smtp_sink import start_smtp_sink  # noqa: E402
+from harness.textit_stub import start_stub_gateway  # noqa: E402
+from notification import EmailAgent, EmailMessageFormatter, EmailSubscriberFilter, FanOutNotifier, \
+    TexitMessageFormatter, TexitSubscriberFilter, TextitAgent, TextitNotifier  # noqa: E402
+from subscriber import Subscriber, SubscriberCollection  # noqa: E402
+
+
+def make_announcements(count: int) -> AnnouncementCollection:
+    published = datetime(2020, 8, 14, 10, 30, tzinfo=timezone.utc)
+    return AnnouncementCollection().set_collection([
+        Announcement(None, 'Announcement {}'.format(i), 'http://bit.lk/index.php/2020/08/14/post-{}/'.format(i),
+                     published, None, datetime.now(), None, None)
+        for i in range(count)
+    ])
+
+
+def make_subscribers(count: int) -> SubscriberCollection:
+    subscribers = []
+    for i in range(count):
+        contact = '9477{:07d}'.format(i) if i % 2 == 0 else 'subscriber{}@example.com'.format(i)
+        subscribers.append(Subscriber('subscriber {}'.format(i), contact, 'active'))
+    return SubscriberCollection().set_collection(subscribers)
+
+
+def make_notifiers(announcements: AnnouncementCollection, subscribers: SubscriberCollection,
+                   email_agent: EmailAgent) -> list:
+    return [
+        TextitNotifier(announcements, TexitMessageFormatter(), subscribers, TexitSubscriberFilter(), TextitAgent()),
+        TextitNotifier(announcements, EmailMessageFormatter(), subscribers, EmailSubscriberFilter(), email_agent),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--announcements', type=int, default=3)
+    parser.add_argument('--delay', type=float, default=0.02,
+                        help='latency of the gateway, SMTP replies take a fiftieth of it')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    gateway = start_stub_gateway(delay=args.delay)
+    sink = start_smtp_sink(delay=args.delay / 50)
+    load_environment()  # read .env first so it does not override the stub addresses
+    os.environ.update({'TEXTIT_URL': gateway.get_url(), 'SMTP_HOST': '127.0.0.1',
+                       'SMTP_PORT': str(sink.server_address[1])})
+    announcements = make_announcements(args.announcements)
+    subscribers = make_subscribers(args.subscribers)
+
+    email_agent = EmailAgent()
+    start = time.perf_counter()
+    for notifier in make_notifiers(announcements, subscribers, email_agent):
+        notifier.notify()
+    print('sequential: {:.2f}s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    results = FanOutNotifier(make_notifiers(announcements, subscribers, email_agent)).notify()
+    print('fan out:    {:.2f}s'.format(time.perf_counter() - start))
+    email_agent.close()
+
+    for channel, channel_results in zip(('textit', 'email'), results):
+        delivered = sum(len(result.get_delivered_recipients()) for result in channel_results)
+        print('{0}: {1} batches, {2} recipient messages delivered'.format(channel, len(channel_results), delivered))
+    print('gateway {0}\nsmtp sink {1}'.format(gateway.get_stats(), sink.get_stats()))
+    assert sink.get_stats()['connections'] == 1
+    gateway.shutdown()
+    sink.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Run the pipeline of app.py end to end against the local site stub and stub gateway
+
+    python harness/load_test.py [--announcements 1000] [--subscribers 100000] [--site-delay 0.01]
+                                [--gateway-delay 0.05] [--fail-rate 0.01] [--slow-rate 0.01] [--slow-delay 1.0]
+                                [--sources 1] [--digest] [--trace-memory]
+
+A Pipeline of app.py is pointed at the stubs and run once: the listing page of each site stub lists all its
+announcements and is a source of the generated sources file. A subscribers file of SMS subscribers is generated, and
+the caches, metrics and log go to a temporary directory. A second run checks the unchanged pages. The announcements
+are stored, and the notifications are queued and delivered, through the database configured in .env. That must be a
+scratch database with the tables of the ban_app_db_*.sql files. Titles include a run id so every run adds new
+announcements.
+
+Reports the time and throughput of each stage, the latency percentiles of the requests to the site and the gateway
+and the peak memory. The stubs run in the same process, so the peak resident memory includes them.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+from harness.site_stub import LISTING_PATH, start_site_stub  # noqa: E402
+from harness.textit_stub import start_stub_gateway  # noqa: E402
+from logging_lib import configure_logging  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+
+class LatencyRecorder:
+    """Times every request made with an http client, grouped into listing, detail and gateway requests"""
+
+    def __init__(self, http_client):
+        self.request = http_client.request
+        self.latencies = {}
+        self.lock = threading.Lock()
+        http_client.request = self.timed_request
+
+    def timed_request(self, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.request(method, url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.setdefault(self.get_group(url), []).append(elapsed)
+
+    @staticmethod
+    def get_group(url: str) -> str:
+        if '/sendmsg/' in url:
+            return 'gateway'
+        if LISTING_PATH in url:
+            return 'listing'
+        return 'detail'
+
+
+def get_percentile(sorted_values: list, percent: float) -> float:
+    """Nearest rank percentile of a sorted list"""
+    rank = max(1, min(len(sorted_values), round(percent / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+@contextmanager
+def trace_memory() -> Iterator[None]:
+    """Record the peak memory traced by tracemalloc in the with block as the peak_traced_memory_bytes gauge"""
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        metrics.set_gauge('peak_traced_memory_bytes', tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+
+def write_subscriber_file(directory: str, count: int) -> str:
+    subscriber_file = os.path.join(directory, 'subscribers.json')
+    with open(subscriber_file, 'w') as subscriber_data:
+        json.dump([
+            {'name': 'subscriber {}'.format(i), 'contact': '9477{:07d}'.format(i), 'status': 'active'}
+            for i in range(count)
+        ], subscriber_data)
+    return subscriber_file
+
+
+def write_sources_file(directory: str, sites: list) -> str:
+    sources_file = os.path.join(directory, 'sources.json')
+    with open(sources_file, 'w') as source_data:
+        json.dump([
+            {
+                'name': 'site-{}'.format(i),
+                'page_url': site.get_listing_url(),
+                'html_element': 'article',
+                'id_name': 'post-6',
+                'class_names': 'post-6 page type-page status-publish hentry',
+            }
+            for i, site in enumerate(sites)
+        ], source_data)
+    return sources_file
+
+
+def get_host(server) -> str:
+    return '{0}:{1}'.format(*server.server_address)
+
+
+def configure_app(args: argparse.Namespace, directory: str, sites: list, gateway_host: str) -> None:
+    """Point the settings of app.py at the stubs and the temporary directory"""
+    app.sources_file = write_sources_file(directory, sites)
+    app.subscriber_store = 'json'
+    app.subscribers_file = write_subscriber_file(directory, args.subscribers)
+    app.validator_cache_file = os.path.join(directory, 'validator_cache.json')
+    app.outbox_pending_file = os.path.join(directory, 'outbox_pending')
+    app.metrics_textfile = os.path.join(directory, 'metrics.prom')
+    app.run_summary_file = os.path.join(directory, 'run_summary.json')
+    app.notification_channels = ['textit']
+    app.fetch_rate = args.fetch_rate
+    app.fetch_burst = args.fetch_workers
+    app.fetch_workers = args.fetch_workers
+    app.textit_workers = args.textit_workers
+    app.textit_digest = args.digest
+    app.http_host_pool_sizes = {get_host(site): args.fetch_workers for site in sites}
+    app.http_host_pool_sizes[gateway_host] = args.textit_workers
+
+
+def print_report(args: argparse.Namespace, summary: dict, recorder: LatencyRecorder, site_stats: dict,
+                 gateway_stats: dict, new_announcements: int) -> None:
+    stages = summary['stages']
+    print('{0} new announcements from {1} sources, {2} subscribers, {3:.2f}s'.format(
+        new_announcements, args.sources, args.subscribers, summary['duration_seconds']))
+    print('\n{:<18} {:>10}  {}'.format('stage', 'seconds', 'throughput'))
+    throughput = {
+        'update_datetime': (site_stats['detail_requests'], 'detail pages'),
+        'store': (summary['counters'].get('notifications_queued', 0), 'notifications queued'),
+        'deliver': (gateway_stats['recipients'], 'recipient messages'),
+    }
+    for stage, seconds in stages.items():
+        line = '{:<18} {:>10.3f}'.format(stage, seconds)
+        if stage in throughput and seconds > 0:
+            count, unit = throughput[stage]
+            line += '  {0:.0f} {1}/s'.format(count / seconds, unit)
+        print(line)
+
+    print('\n{:<10} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('requests', 'count', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                             'max ms'))
+    for group, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        print('{:<10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            group, len(latencies), *(get_percentile(latencies, p) * 1000 for p in (50, 95, 99)),
+            latencies[-1] * 1000))
+
+    print('\npeak resident memory {:.1f} MiB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    if 'peak_traced_memory_bytes' in summary['gauges']:
+        print('peak traced memory {:.1f} MiB'.format(summary['gauges']['peak_traced_memory_bytes'] / 1024 / 1024))
+    print('counters {}'.format(summary['counters']))
+    print('site {0}\ngateway {1}'.format(site_stats, gateway_stats))
+
+
+def get_site_stats(sites: list) -> dict:
+    stats = {}
+    for site in sites:
+        for name, value in site.get_stats().items():
+            stats[name] = stats.get(name, 0) + value
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--announcements', type=int, default=1000)
+    parser.add_argument('--subscribers', type=int, default=100000)
+    parser.add_argument('--site-delay', type=float, default=0.01, help='latency of every page of the site')
+    parser.add_argument('--gateway-delay', type=float, default=0.05, help='latency of the gateway')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of gateway requests that fail')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of gateway requests that are slow')
+    parser.add_argument('--slow-delay', type=float, default=1.0, help='latency of a slow gateway request')
+    parser.add_argument('--fetch-rate', type=float, default=1000.0, help='detail page requests per second')
+    parser.add_argument('--fetch-workers', type=int, default=app.fetch_workers)
+    parser.add_argument('--textit-workers', type=int, default=app.textit_workers)
+    parser.add_argument('--sources', type=int, default=1, help='site stubs polled at once, each with all announcements')
+    parser.add_argument('--digest', action='store_true', help='send one digest message per recipient batch')
+    parser.add_argument('--trace-memory', action='store_true', help='trace the peak memory of the first run, slower')
+    args = parser.parse_args()
+
+    sites = [start_site_stub(announcements=args.announcements, per_page=args.announcements, delay=args.site_delay)
+             for _ in range(args.sources)]
+    gateway = start_stub_gateway(fail_rate=args.fail_rate, delay=args.gateway_delay, slow_rate=args.slow_rate,
+                                 slow_delay=args.slow_delay)
+    os.environ['TEXTIT_URL'] = gateway.get_url()  # app loaded .env when it was imported, it does not override this
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_logging(os.path.join(directory, 'app.log'), console=False)
+        configure_app(args, directory, sites, get_host(gateway))
+        pipeline = app.Pipeline()
+        recorder = LatencyRecorder(pipeline.http_client)
+        try:
+            metrics.reset()
+            with trace_memory() if args.trace_memory else nullcontext():
+                new_collections = pipeline.run()
+            summary = metrics.get_summary(True)
+            print_report(args, summary, recorder, get_site_stats(sites), gateway.get_stats(),
+                         sum(new_collection.get_size() for new_collection in new_collections or []))
+
+            metrics.reset()
+            start = time.perf_counter()
+            unchanged = pipeline.run()
+            print('\nsecond run {0} in {1:.3f}s'.format(
+                'found the pages unchanged' if unchanged is None else 'found a page changed',
+                time.perf_counter() - start))
+        finally:
+            pipeline.close()
+    for site in sites:
+        site.shutdown()
+    gateway.shutdown()
+
+
+if __name__ == '__main__':
+    main()
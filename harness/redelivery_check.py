@@ -0,0 +1,95 @@
+"""
+Check a notification left undelivered by one run is delivered by the next run although the page has not changed
+
+    python harness/redelivery_check.py [--announcements 3] [--subscribers 100] [--retry-delay 10]
+
+The first run of a Pipeline of app.py stores the announcements of a site stub while the stub gateway fails every
+request, so all queued notifications stay pending until `retry-delay` seconds later. The gateway then recovers and
+the second run, started once they are due again, finds the page unchanged and must deliver every one of them. Exits
+with an error if it does not. Like load_test.py it needs a scratch database with the tables of the ban_app_db_*.sql
+files configured in .env.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+from harness.load_test import get_host, write_subscriber_file  # noqa: E402
+from harness.site_stub import start_site_stub  # noqa: E402
+from harness.textit_stub import start_stub_gateway  # noqa: E402
+from source import Source  # noqa: E402
+
+
+def get_status_counts(pipeline: app.Pipeline, source: str) -> dict:
+    sql = 'SELECT status, count(*) FROM notification_outbox WHERE source = %s GROUP BY status'
+    with pipeline.get_database().transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql, (source,))
+        return dict(cursor.fetchall())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--announcements', type=int, default=3)
+    parser.add_argument('--subscribers', type=int, default=100)
+    parser.add_argument('--retry-delay', type=float, default=10.0,
+                        help='longer than the first run takes to give up on the failing gateway')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    site = start_site_stub(announcements=args.announcements, per_page=args.announcements)
+    gateway = start_stub_gateway(fail_rate=1.0)
+    os.environ['TEXTIT_URL'] = gateway.get_url()  # app loaded .env when it was imported, it does not override this
+    source = Source('redelivery-{}'.format(site.run_id), site.get_listing_url(), 'article', 'post-6',
+                    'post-6 page type-page status-publish hentry')
+
+    with tempfile.TemporaryDirectory() as directory:
+        app.subscriber_store = 'json'
+        app.subscribers_file = write_subscriber_file(directory, args.subscribers)
+        app.validator_cache_file = os.path.join(directory, 'validator_cache.json')
+        app.outbox_pending_file = os.path.join(directory, 'outbox_pending')
+        app.metrics_textfile = os.path.join(directory, 'metrics.prom')
+        app.run_summary_file = os.path.join(directory, 'run_summary.json')
+        app.notification_channels = ['textit']
+        app.outbox_retry_delay = args.retry_delay
+        app.http_host_pool_sizes = {get_host(site): app.fetch_workers, get_host(gateway): app.textit_workers}
+        pipeline = app.Pipeline()
+        pipeline.sources = [source]
+        try:
+            new_collections = pipeline.run()
+            if new_collections is None:
+                sys.exit('first run found no new announcements')
+            after_failure = get_status_counts(pipeline, source.get_name())
+            print('after the failed delivery: {}'.format(after_failure))
+            if after_failure.get('pending', 0) == 0 or set(after_failure) != {'pending'}:
+                sys.exit('the failed delivery did not leave only pending notifications')
+            if not os.path.exists(app.outbox_pending_file):
+                sys.exit('the failed delivery left no outbox pending file for the next run')
+
+            gateway.fail_rate = 0.0
+            time.sleep(args.retry_delay)
+            start = time.perf_counter()
+            if pipeline.run() is not None:
+                sys.exit('second run found the page changed')
+            after_retry = get_status_counts(pipeline, source.get_name())
+            print('after the unchanged run: {0} in {1:.3f}s'.format(after_retry, time.perf_counter() - start))
+            if after_retry != {'sent': after_failure['pending']}:
+                sys.exit('the unchanged run did not deliver the pending notifications')
+            if gateway.get_stats()['unique_recipients'] != args.subscribers:
+                sys.exit('the gateway did not receive every subscriber: {}'.format(gateway.get_stats()))
+            if os.path.exists(app.outbox_pending_file):
+                sys.exit('the outbox pending file was left after every notification was delivered')
+        finally:
+            pipeline.close()
+    site.shutdown()
+    gateway.shutdown()
+    print('pending notifications were delivered by the run that found the page unchanged')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+A local stand-in for the bit.lk announcement pages
+
+    python harness/site_stub.py [--port 8024] [--announcements 1000] [--per-page 1000] [--delay 0.01]
+
+Serves generated announcement listing pages at /index.php/category/announcement/page/<n> and a detail page for every
+announcement, in the markup the Scraper expects: h4 title links followed by a strong date line as children of the
+post-6 article, and published and updated time elements on the detail pages. Page 1 lists the newest announcements.
+Every page is answered after `delay` seconds. Point the app at it by setting target_page_url to get_listing_url().
+"""
+import argparse
+import html
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LISTING_PATH = '/index.php/category/announcement/page/'
+POST_PATH = '/index.php/{0:%Y/%m/%d}/post-{1}/'
+
+PAGE_HEAD = '<!DOCTYPE html>\n<html lang="en-US">\n<head>\n<meta charset="UTF-8">\n<title>{0}</title>\n</head>\n' \
+            '<body class="page">\n<div id="content" class="site-content">\n<div id="primary" class="content-area">\n' \
+            '<main id="main" class="site-main" role="main">\n'
+PAGE_TAIL = '</main>\n</div>\n</div>\n</body>\n</html>\n'
+LISTING_ITEM = '<h4><a href="{url}">{title}</a></h4>\n<strong>{date} by <a href="{author}">bitadmin</a></strong>\n' \
+               '<p>Students are hereby informed that the examination schedule is available on the portal&#8230;</p>\n'
+DETAIL_META = '<div class="entry-meta"><span class="posted-on">Posted on <a href="{url}" rel="bookmark">' \
+              '<time class="entry-date published" datetime="{published}">{published_date}</time>' \
+              '<time class="updated" datetime="{updated}">{updated_date}</time></a></span></div>\n'
+
+SRI_LANKA = timezone(timedelta(hours=5, minutes=30))
+
+
+def get_ordinal_suffix(day: int) -> str:
+    if 10 < day % 100 < 14:
+        return 'th'
+    return {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
+
+
+class SiteStub(ThreadingHTTPServer):
+    """
+    Serve `announcements` generated announcements, `per_page` to a listing page
+
+    Announcement i is published i hours before the newest one, so several announcements share a day like on the real
+    site. Titles include `run_id` so the announcements of different runs are different announcements.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, announcements: int = 1000, per_page: int = 10, delay: float = 0.0,
+                 run_id: str = None):
+        super().__init__(address, SiteStubHandler)
+        self.per_page = per_page
+        self.delay = delay
+        self.run_id = run_id if run_id is not None else datetime.now().strftime('%Y%m%d%H%M%S')
+        self.newest = datetime.now(SRI_LANKA).replace(microsecond=0)
+        self.announcement_count = announcements
+        self.lock = threading.Lock()
+        self.listing_requests = 0
+        self.detail_requests = 0
+
+    def get_base_url(self) -> str:
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def get_listing_url(self) -> str:
+        """Returns the listing page url with a {} placeholder for the page number, like app.target_page_url"""
+        return self.get_base_url() + LISTING_PATH + '{}'
+
+    def get_published_datetime(self, number: int) -> datetime:
+        return self.newest - timedelta(hours=number)
+
+    def get_post_path(self, number: int) -> str:
+        return POST_PATH.format(self.get_published_datetime(number), number)
+
+    def get_title(self, number: int) -> str:
+        return 'Load Test Announcement {0} of Run {1}'.format(number, self.run_id)
+
+    def render_listing(self, page: int) -> str:
+        items = []
+        for number in range((page - 1) * self.per_page, min(page * self.per_page, self.announcement_count)):
+            published = self.get_published_datetime(number)
+            items.append(LISTING_ITEM.format(
+                url=self.get_base_url() + self.get_post_path(number),
+                title=html.escape(self.get_title(number)),
+                date='{0:%B} {1}{2}, {0:%Y}'.format(published, published.day, get_ordinal_suffix(published.day)),
+                author=self.get_base_url() + '/index.php/author/bitadmin/'
+            ))
+        return PAGE_HEAD.format('Announcements') + \
+            '<article id="post-6" class="post-6 page type-page status-publish hentry">\n' \
+            '<header class="entry-header"><h1 class="entry-title">Announcements</h1></header>\n' + \
+            ''.join(items) + '</article>\n' + PAGE_TAIL
+
+    def render_detail(self, number: int) -> str:
+        published = self.get_published_datetime(number)
+        updated = published + timedelta(minutes=30)
+        return PAGE_HEAD.format(html.escape(self.get_title(number))) + \
+            '<article id="post-{0}" class="post-{0} post type-post status-publish hentry">\n'.format(number) + \
+            '<header class="entry-header"><h1 class="entry-title">{}</h1>\n'.format(
+                html.escape(self.get_title(number))) + \
+            DETAIL_META.format(
+                url=self.get_base_url() + self.get_post_path(number),
+                published=published.isoformat(), published_date='{0:%B} {0.day}, {0:%Y}'.format(published),
+                updated=updated.isoformat(), updated_date='{0:%B} {0.day}, {0:%Y}'.format(updated)
+            ) + \
+            '</header>\n<div class="entry-content"><p>Details of the announcement.</p></div>\n</article>\n' + \
+            PAGE_TAIL
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {'listing_requests': self.listing_requests, 'detail_requests': self.detail_requests}
+
+
+class SiteStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        site = self.server
+        time.sleep(site.delay)
+        path = self.path.split('?')[0]
+        if path.startswith(LISTING_PATH) and path[len(LISTING_PATH):].strip('/').isdigit():
+            page = int(path[len(LISTING_PATH):].strip('/'))
+            if page < 1 or (page - 1) * site.per_page >= site.announcement_count:
+                self.reply(404, 'Page not found')
+                return
+            with site.lock:
+                site.listing_requests += 1
+            self.reply(200, site.render_listing(page))
+            return
+        number = path.rstrip('/').rsplit('/post-', 1)[-1]
+        if '/post-' in path and number.isdigit() and int(number) < site.announcement_count:
+            with site.lock:
+                site.detail_requests += 1
+            self.reply(200, site.render_detail(int(number)))
+            return
+        self.reply(404, 'Page not found')
+
+    def reply(self, status_code: int, text: str) -> None:
+        body = text.encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_site_stub(port: int = 0, announcements: int = 1000, per_page: int = 10, delay: float = 0.0,
+                    run_id: str = None) -> SiteStub:
+    """Serve a stub site from a background thread. Port 0 picks a free port"""
+    site = SiteStub(('127.0.0.1', port), announcements, per_page, delay, run_id)
+    threading.Thread(target=site.serve_forever, daemon=True).start()
+    return site
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8024)
+    parser.add_argument('--announcements', type=int, default=1000)
+    parser.add_argument('--per-page', type=int, default=1000)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    stub = SiteStub(('127.0.0.1', args.port), args.announcements, args.per_page, args.delay)
+    print('site stub on {}'.format(stub.get_listing_url().format(1)))
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(stub.get_stats())
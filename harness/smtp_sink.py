@@ -0,0 +1,102 @@
+"""
+A local SMTP server that accepts every message and keeps count of what it received
+
+    python harness/smtp_sink.py [--port 8026] [--delay 0.01]
+
+Speaks enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) and answers each command after
+`delay` seconds to simulate a remote server. The recipients of `refused` are refused with their reply, e.g.
+{'full@example.com': '452 Mailbox full'}. Point the app at it with SMTP_HOST=127.0.0.1 SMTP_PORT=8026
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, delay: float = 0.0, refused: dict = None):
+        super().__init__(address, SmtpSinkHandler)
+        self.delay = delay
+        self.refused = refused if refused is not None else {}
+        self.lock = threading.Lock()
+        self.connection_count = 0
+        self.message_count = 0
+        self.recipients = []
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'connections': self.connection_count,
+                'messages': self.message_count,
+                'recipients': len(self.recipients),
+                'unique_recipients': len(set(self.recipients)),
+            }
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connection_count += 1
+        self.reply('220 smtp sink ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            time.sleep(sink.delay)
+            if verb == 'EHLO' or verb == 'HELO':
+                self.reply('250 smtp sink')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.partition(':')[2].strip().strip('<>')
+                if recipient in sink.refused:
+                    self.reply(sink.refused[recipient])
+                    continue
+                recipients.append(recipient)
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                with sink.lock:
+                    sink.message_count += 1
+                    sink.recipients.extend(recipients)
+                self.reply('250 OK queued')
+            elif verb == 'RSET' or verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+
+def start_smtp_sink(port: int = 0, delay: float = 0.0, refused: dict = None) -> SmtpSink:
+    """Serve an SMTP sink from a background thread. Port 0 picks a free port"""
+    sink = SmtpSink(('127.0.0.1', port), delay, refused)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8026)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    smtp_sink = SmtpSink(('127.0.0.1', args.port), args.delay)
+    print('smtp sink on 127.0.0.1:{}'.format(args.port))
+    try:
+        smtp_sink.serve_forever()
+    except KeyboardInterrupt:
+        print(smtp_sink.get_stats())
@@ -0,0 +1,62 @@
+"""
+Send a message to generated recipients through TextitAgent and a local stub gateway and check every recipient got it
+
+    python harness/textit_dispatch.py [--recipients 2500] [--fail-rate 0.2] [--delay 0.05]
+
+Compares a single sequential worker with the configured worker pool and prints the batch results and gateway counts.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from env_lib import load_environment  # noqa: E402
+from harness.textit_stub import start_stub_gateway  # noqa: E402
+from notification import TextitAgent  # noqa: E402
+
+
+def dispatch(recipients: list, workers: int, args: argparse.Namespace) -> None:
+    gateway = start_stub_gateway(fail_rate=args.fail_rate, delay=args.delay, max_recipients=args.batch_size)
+    load_environment()  # read .env first so it does not override the stub address
+    os.environ['TEXTIT_URL'] = gateway.get_url()
+    agent = TextitAgent(batch_size=args.batch_size, max_workers=workers, max_attempts=args.attempts,
+                        backoff=args.backoff)
+    start = time.perf_counter()
+    results = agent.send('(test) BIT Announcement', recipients)
+    elapsed = time.perf_counter() - start
+    gateway.shutdown()
+
+    delivered = [result for result in results if result.is_delivered()]
+    retried = [result for result in results if result.get_attempts() > 1]
+    stats = gateway.get_stats()
+    print('workers {0:>2}: {1:.2f}s, batches {2}, delivered {3}, retried {4}, gateway {5}'.format(
+        workers, elapsed, len(results), len(delivered), len(retried), stats))
+    delivered_recipients = sum(len(result.get_recipients()) for result in delivered)
+    assert stats['unique_recipients'] == delivered_recipients
+    for result in results:
+        if not result.is_delivered():
+            print('  not delivered: {}'.format(result))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=2500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=0.05)
+    parser.add_argument('--fail-rate', type=float, default=0.2)
+    parser.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)  # the agent logs every failed attempt
+    recipients = ['9477{:07d}'.format(i) for i in range(args.recipients)]
+    for workers in (1, args.workers):
+        dispatch(recipients, workers, args)
+
+
+if __name__ == '__main__':
+    main()
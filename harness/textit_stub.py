@@ -0,0 +1,108 @@
+"""
+A local stand-in for the textit.biz SMS gateway
+
+    python harness/textit_stub.py [--port 8025] [--fail-rate 0.2] [--delay 0.05] [--max-recipients 100]
+                                  [--slow-rate 0.01] [--slow-delay 1.0]
+
+Accepts the form posts TextitAgent makes and answers "OK:<id>" like the gateway. A request fails with a 503 at
+`fail-rate` and is answered after `delay` seconds, or after `slow-delay` seconds at `slow-rate` to simulate the slow
+tail of a remote gateway. A request with more than `max-recipients` numbers gets an error response. Point the app
+at it with TEXTIT_URL=http://127.0.0.1:8025/sendmsg/index.php
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class TextitStubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, fail_rate: float = 0.0, delay: float = 0.0, max_recipients: int = 100,
+                 slow_rate: float = 0.0, slow_delay: float = 1.0):
+        super().__init__(address, TextitStubHandler)
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.max_recipients = max_recipients
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.lock = threading.Lock()
+        self.message_count = 0
+        self.failed_count = 0
+        self.recipients = []
+
+    def get_url(self) -> str:
+        return 'http://{0}:{1}/sendmsg/index.php'.format(*self.server_address)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.message_count + self.failed_count,
+                'accepted': self.message_count,
+                'failed': self.failed_count,
+                'recipients': len(self.recipients),
+                'unique_recipients': len(set(self.recipients)),
+            }
+
+
+class TextitStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        gateway = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        time.sleep(gateway.slow_delay if random.random() < gateway.slow_rate else gateway.delay)
+
+        recipients = form.get('to', [''])[0].split(',')
+        if random.random() < gateway.fail_rate:
+            with gateway.lock:
+                gateway.failed_count += 1
+            self.reply(503, 'Service Unavailable')
+        elif len(recipients) > gateway.max_recipients:
+            with gateway.lock:
+                gateway.failed_count += 1
+            self.reply(200, 'Error:Too many recipients')
+        else:
+            with gateway.lock:
+                gateway.message_count += 1
+                gateway.recipients.extend(recipients)
+                message_id = gateway.message_count
+            self.reply(200, 'OK:{}'.format(message_id))
+
+    def reply(self, status_code: int, text: str) -> None:
+        body = text.encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_gateway(port: int = 0, fail_rate: float = 0.0, delay: float = 0.0, max_recipients: int = 100,
+                       slow_rate: float = 0.0, slow_delay: float = 1.0) -> TextitStubGateway:
+    """Serve a stub gateway from a background thread. Port 0 picks a free port"""
+    gateway = TextitStubGateway(('127.0.0.1', port), fail_rate, delay, max_recipients, slow_rate, slow_delay)
+    threading.Thread(target=gateway.serve_forever, daemon=True).start()
+    return gateway
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--max-recipients', type=int, default=100)
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-delay', type=float, default=1.0)
+    args = parser.parse_args()
+    stub = TextitStubGateway(('127.0.0.1', args.port), args.fail_rate, args.delay, args.max_recipients,
+                             args.slow_rate, args.slow_delay)
+    print('textit stub gateway on {}'.format(stub.get_url()))
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(stub.get_stats())
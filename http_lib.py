@@ -0,0 +1,80 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """
+    A requests session shared by the scraper and the notification agents
+
+    Connections are pooled and kept alive between requests. Every request gets the default connect and read timeouts
+    unless a timeout is given explicitly.
+
+    :param connect_timeout: Seconds to wait for a connection to be established
+    :param read_timeout: Seconds to wait between bytes received from the server
+    :param pool_connections: Number of hosts to keep connection pools for
+    :param pool_maxsize: Number of connections kept alive per host
+    :param host_pool_sizes: Number of connections kept alive for specific hosts e.g. {'bit.lk': 5}
+    """
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 30.0, pool_connections: int = 10,
+                 pool_maxsize: int = 10, host_pool_sizes: dict = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.adapters = []
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+        default_adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.mount(['http://', 'https://'], default_adapter)
+        for host, pool_size in (host_pool_sizes or {}).items():
+            self.mount(['http://{}/'.format(host), 'https://{}/'.format(host)],
+                       HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def mount(self, prefixes: list, adapter: HTTPAdapter) -> None:
+        for prefix in prefixes:
+            self.session.mount(prefix, adapter)
+        self.adapters.append(adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        with self.lock:
+            self.request_count += 1
+        metrics.increment('http_requests')
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get_stats(self) -> dict:
+        """
+        Returns request and connection counters of the session
+
+        Counters are read from the connection pools that are currently open. A reused connection is a request that
+        did not need a new TCP connection.
+        """
+        new_connections = 0
+        pooled_requests = 0
+        for adapter in self.adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                new_connections += pool.num_connections
+                pooled_requests += pool.num_requests
+        return {
+            'requests': self.request_count,
+            'new_connections': new_connections,
+            'reused_connections': max(pooled_requests - new_connections, 0),
+        }
+
+    def close(self) -> None:
+        self.session.close()
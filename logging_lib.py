@@ -0,0 +1,186 @@
+"""
+Logging bootstrap for the entry points
+
+Modules only create their logger with logging.getLogger(__name__), importing a module opens no files. An entry point
+calls configure_logging() once. Log records are put on a queue by the calling thread and written to the log file and
+the console by a background thread, so a log call never waits on disk or terminal I/O. Worker processes send their
+records to the same thread through a process queue, see get_worker_initializer().
+
+Configured from the environment unless given explicitly:
+
+    LOG_LEVEL=INFO                              level of every module
+    LOG_LEVELS=scraper=DEBUG,http_lib=WARNING   level of single modules
+    LOG_FORMAT=json                             one JSON object per line instead of text
+    LOG_ROTATION=size                           size (LOG_MAX_BYTES), time (LOG_WHEN) or none
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import multiprocessing
+
+TEXT_FORMAT = '%(asctime)s:%(name)s:%(funcName)s(): %(message)s'
+
+listener = None
+worker_listener = None  # writes the records of worker processes, started by the first get_worker_initializer()
+levels = ('INFO', {})  # level and module levels of the last configure_logging() for the worker processes
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the queue with the message and traceback rendered but not yet formatted"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()  # args may not be safe to use from another thread
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # tracebacks hold references to frames
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a JSON object on one line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'function': record.funcName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_module_levels(module_levels: str) -> dict:
+    """Parses 'scraper=DEBUG,http_lib=WARNING' into {'scraper': 'DEBUG', 'http_lib': 'WARNING'}"""
+    levels = {}
+    for item in module_levels.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def get_file_handler(log_file: str, rotation: str, max_bytes: int, when: str, backup_count: int) -> logging.Handler:
+    if rotation == 'size':
+        return logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    if rotation == 'time':
+        return logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count)
+    return logging.FileHandler(log_file)
+
+
+def configure_logging(log_file: Union[None, str] = 'app.log', level: str = None, module_levels: dict = None,
+                      json_format: bool = None, rotation: str = None, max_bytes: int = None, when: str = None,
+                      backup_count: int = 5, console: bool = True) -> logging.handlers.QueueListener:
+    """
+    Send the log records of all modules through a queue to a file and the console written from a background thread
+
+    Calling it again replaces the previous configuration. The queue is flushed at exit.
+
+    :param log_file: File to write to, None to only log to the console
+    :param level: Level of every module, default LOG_LEVEL or INFO
+    :param module_levels: Levels of single modules e.g. {'scraper': 'DEBUG'}, default LOG_LEVELS
+    :param json_format: Write JSON lines, default LOG_FORMAT == 'json'
+    :param rotation: 'size', 'time' or 'none', default LOG_ROTATION or 'size'
+    :param max_bytes: Size a log file is rotated at, default LOG_MAX_BYTES or 10 MiB
+    :param when: When a log file is rotated with time rotation, default LOG_WHEN or 'midnight'
+    :return: The started queue listener
+    """
+    global listener, levels
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    module_levels = module_levels if module_levels is not None else parse_module_levels(
+        os.environ.get('LOG_LEVELS', ''))
+    json_format = json_format if json_format is not None else os.environ.get('LOG_FORMAT', '').lower() == 'json'
+    rotation = rotation or os.environ.get('LOG_ROTATION', 'size')
+    max_bytes = max_bytes or int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    when = when or os.environ.get('LOG_WHEN', 'midnight')
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if log_file is not None:
+        handlers.append(get_file_handler(log_file, rotation, max_bytes, when, backup_count))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level.upper())
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    levels = (level.upper(), module_levels)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def get_worker_initializer() -> tuple:
+    """
+    Returns the initializer and its arguments that send the log records of a worker process to this process' log
+
+    Pass them to a ProcessPoolExecutor. A forked worker inherits the queue handler of this process but not the thread
+    that writes the queue, so without them its records are never written.
+
+    :return: (initializer, initargs), (None, ()) if configure_logging() was not called
+    """
+    global worker_listener
+    if listener is None:
+        return None, ()
+    if worker_listener is None:
+        import multiprocessing
+
+        worker_listener = logging.handlers.QueueListener(multiprocessing.Queue(), *listener.handlers,
+                                                         respect_handler_level=True)
+        worker_listener.start()
+    return configure_worker_logging, (worker_listener.queue, *levels)
+
+
+def configure_worker_logging(log_queue: 'multiprocessing.Queue', level: str, module_levels: dict) -> None:
+    """Put the log records of a worker process on the queue of the worker listener of its parent process"""
+    global listener, worker_listener
+    listener = None  # the inherited listeners belong to the parent process
+    worker_listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+
+def stop_logging() -> None:
+    """Write the records still on the queues and close the log file"""
+    global listener, worker_listener
+    if listener is None:
+        return
+    if worker_listener is not None:
+        worker_listener.stop()
+        worker_listener = None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    listener = None
+worker_listener = None  # writes the records of worker processes, started by the first get_worker_initializer()
+levels = ('INFO', {})  # level and module levels of the last configure_logging() for the worker processes
+
+
+atexit.register(stop_logging)
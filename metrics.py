@@ -0,0 +1,175 @@
+"""
+Timings and counters of a pipeline run, written as a Prometheus textfile and a JSON run summary
+
+Components count what they do through the module level `metrics` e.g. metrics.increment('http_requests'). The
+pipeline times its stages with metrics.stage('fetch_listing') and resets the metrics at the start of each run, so the
+files always describe the last run.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'bit_announcement_notifier'
+
+COUNTER_HELP = {
+    'sources_polled': 'Sources whose announcement page was fetched',
+    'sources_changed': 'Sources whose announcement page changed since the last fetch',
+    'http_requests': 'HTTP requests made',
+    'http_bytes': 'Bytes of web pages downloaded',
+    'http_not_modified': 'Web pages that had not changed since the last fetch',
+    'announcements_parsed': 'Announcements parsed from web pages',
+    'announcements_new': 'Announcements that were not stored',
+    'database_transactions': 'Database transactions',
+    'database_statements': 'Database statements sent, each a round trip, including the fetches of server side cursors',
+    'notifications_queued': 'Notification outbox rows queued',
+    'notifications_failed': 'Notification outbox rows marked failed without being delivered',
+    'sms_batches': 'SMS recipient batches sent to the gateway',
+    'sms_batches_failed': 'SMS recipient batches the gateway did not accept after all attempts',
+    'sms_requests': 'Requests made to the SMS gateway including retries',
+    'email_batches': 'Email recipient batches sent to the SMTP server',
+    'email_batches_failed': 'Email recipient batches the SMTP server did not accept',
+    'email_recipients_refused': 'Email recipients the SMTP server refused',
+}
+
+
+class RunMetrics:
+    """Thread safe counters and stage timings of one run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}  # stage -> seconds, in the order the stages ran
+        self.gauges = {}
+        self.started_at = time.time()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {}
+            self.stages = {}
+            self.gauges = {}
+            self.started_at = time.time()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    def get_counter(self, name: str) -> int:
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the code of the with block as the stage. A stage entered again adds to its time
+
+        A stage entered by several threads at once adds up the time of every thread, so it can take longer than the
+        run. Time the block that runs the threads as a stage of its own for the wall time.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def get_summary(self, succeeded: bool) -> dict:
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'succeeded': succeeded,
+                'stages': dict(self.stages),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def write_json_summary(self, summary_file: str, succeeded: bool) -> None:
+        write_atomic(summary_file, json.dumps(self.get_summary(succeeded), indent=2))
+
+    def write_prometheus_textfile(self, textfile: str, succeeded: bool) -> None:
+        """Write the metrics in the Prometheus text format e.g. for the node exporter textfile collector"""
+        summary = self.get_summary(succeeded)
+        lines = [
+            '# HELP {0}_last_run_timestamp_seconds Time the last run started'.format(METRIC_PREFIX),
+            '# TYPE {0}_last_run_timestamp_seconds gauge'.format(METRIC_PREFIX),
+            '{0}_last_run_timestamp_seconds {1:.3f}'.format(METRIC_PREFIX, summary['started_at']),
+            '# HELP {0}_last_run_success Whether the last run succeeded'.format(METRIC_PREFIX),
+            '# TYPE {0}_last_run_success gauge'.format(METRIC_PREFIX),
+            '{0}_last_run_success {1:d}'.format(METRIC_PREFIX, succeeded),
+            '# HELP {0}_last_run_duration_seconds Duration of the last run'.format(METRIC_PREFIX),
+            '# TYPE {0}_last_run_duration_seconds gauge'.format(METRIC_PREFIX),
+            '{0}_last_run_duration_seconds {1:.6f}'.format(METRIC_PREFIX, summary['duration_seconds']),
+            '# HELP {0}_last_run_stage_seconds Time spent in each stage of the last run'.format(METRIC_PREFIX),
+            '# TYPE {0}_last_run_stage_seconds gauge'.format(METRIC_PREFIX),
+        ]
+        for stage_name, seconds in summary['stages'].items():
+            lines.append('{0}_last_run_stage_seconds{{stage="{1}"}} {2:.6f}'.format(
+                METRIC_PREFIX, stage_name, seconds))
+        for name, value in sorted(list(summary['counters'].items()) + list(summary['gauges'].items())):
+            metric = '{0}_last_run_{1}'.format(METRIC_PREFIX, name)
+            lines.append('# HELP {0} {1}'.format(metric, COUNTER_HELP.get(name, name.replace('_', ' '))))
+            lines.append('# TYPE {} gauge'.format(metric))
+            lines.append('{0} {1}'.format(metric, value))
+        write_atomic(textfile, '\n'.join(lines) + '\n')
+
+
+def write_atomic(file_name: str, content: str) -> None:
+    """Write to a temporary file and rename it so a reader never sees a half written file"""
+    temp_file = file_name + '.tmp'
+    with open(temp_file, 'w') as output:
+        output.write(content)
+    os.replace(temp_file, file_name)
+
+
+@contextmanager
+def profile(profile_file: str, trace_memory: bool = False, top: int = 20) -> Iterator[None]:
+    """
+    Profile the code of the with block with cProfile and optionally tracemalloc
+
+    The cProfile stats are saved to profile_file (open with pstats or snakeviz) and the `top` functions by cumulative
+    time are logged. With trace_memory the peak traced memory is recorded as a gauge and the lines that allocated the
+    most are logged. Both slow the code down, use them for a single run. cProfile only sees the calling thread, the
+    work of thread pools shows up as time waiting on locks.
+    """
+    profiler = cProfile.Profile()
+    if trace_memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+        stats = pstats.Stats(profiler)
+        stats.sort_stats('cumulative')
+        rows = []
+        for (file_name, line_number, function), (_, calls, _, cumulative, _) in stats.stats.items():
+            rows.append((cumulative, calls, '{0}:{1}({2})'.format(file_name, line_number, function)))
+        rows.sort(reverse=True)
+        logger.info('Profile saved to {0}. Top {1} by cumulative time:\n{2}'.format(
+            profile_file, top, '\n'.join('{0:10.4f}s {1:8d} {2}'.format(*row) for row in rows[:top])))
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            metrics.set_gauge('peak_traced_memory_bytes', peak)
+            statistics = snapshot.statistics('lineno')[:top]
+            logger.info('Peak traced memory {0:.1f} KiB. Top {1} allocations:\n{2}'.format(
+                peak / 1024, top, '\n'.join(str(statistic) for statistic in statistics)))
+
+
+metrics = RunMetrics()
@@ -1,26 +1,24 @@
 import logging
 import os
-import re
+import random
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from time import sleep
 
 import requests
-from dotenv import load_dotenv, find_dotenv
 
 from announcement import AnnouncementFormatterInterface, AnnouncementCollection
+from env_lib import load_environment
+from http_lib import HttpClient
+from metrics import metrics
+from parsing import is_email_address, is_telephone_number
+from sms import NEWLINE, get_segment_count
 from subscriber import SubscriberFilterInterface, SubscriberCollection
 
-load_dotenv(find_dotenv(), override=True)
-
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler('app.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
 
 
 class NotifierInterface:
@@ -47,10 +45,71 @@ class NotifierInterface:
 
 
 class NotificationAgentInterface:
-    def send(self, message: str, recipients: list):
+    def send(self, message: str, recipients: list) -> list:
+        """Returns a DeliveryResult per batch of recipients the message was sent to"""
         pass
 
 
+class DeliveryResult:
+    """
+    The outcome of sending a message to one batch of recipients
+
+    A server can accept a message for some recipients of a batch and refuse others. The refused recipients are kept
+    with the reply code of the refusal, a 4xx code is transient and the recipient can be sent the message again, a 5xx
+    code is permanent. A batch that is not delivered without refusals, e.g. because the gateway failed, can be sent
+    again to all its recipients.
+
+    :param refused: Reply code of each refused recipient
+    """
+
+    def __init__(self, recipients: list, delivered: bool, attempts: int, response: str = None, refused: dict = None):
+        self.recipients = recipients
+        self.delivered = delivered
+        self.attempts = attempts
+        self.response = response
+        self.refused = refused if refused is not None else {}
+
+    def __str__(self):
+        return 'recipients: {0}, delivered: {1}, attempts: {2}, refused: {3}, response: {4}'.format(
+            len(self.recipients), self.delivered, self.attempts, len(self.refused), self.response)
+
+    def get_recipients(self) -> list:
+        return self.recipients
+
+    def get_attempts(self) -> int:
+        return self.attempts
+
+    def get_response(self) -> str:
+        return self.response
+
+    def get_refused(self) -> dict:
+        return self.refused
+
+    def is_delivered(self) -> bool:
+        """True if the message was accepted, for all recipients but the refused ones"""
+        return self.delivered
+
+    def get_delivered_recipients(self) -> list:
+        if not self.delivered:
+            return []
+        return [recipient for recipient in self.recipients if recipient not in self.refused]
+
+    def get_retry_recipients(self) -> list:
+        """Returns the recipients the message can be sent to again"""
+        if not self.delivered and len(self.refused) == 0:
+            return self.recipients
+        return [recipient for recipient, code in self.refused.items() if is_transient_reply(code)]
+
+    def get_failed_recipients(self) -> list:
+        """Returns the recipients that were refused permanently, sending again would be refused too"""
+        return [recipient for recipient, code in self.refused.items() if not is_transient_reply(code)]
+
+
+def is_transient_reply(code: int) -> bool:
+    """True for a 4xx SMTP reply code, a temporary failure the server expects the client to retry"""
+    return 400 <= code < 500
+
+
 class TextitNotifier(NotifierInterface):
     def __init__(self, a: 'AnnouncementCollection', af: 'AnnouncementFormatterInterface', s: 'SubscriberCollection',
                  sf: 'SubscriberFilterInterface', n: 'NotificationAgentInterface'):
@@ -64,34 +123,69 @@ class TextitNotifier(NotifierInterface):
     def prepare_messages(self):
         return self.announcements.format(self.announcement_formatter)
 
-    def filter_subscribers(self):
-        filtered_subscribers = []
-        subscribers = self.subscribers.filter(self.subscriber_filter)
-        for subscriber in subscribers:
-            filtered_subscribers.append(str(subscriber.get_contact()))
-        return filtered_subscribers
+    def filter_subscribers(self) -> list:
+        return self.subscribers.get_recipients(self.subscriber_filter.get_contact_type())
 
-    def notify(self):
+    def notify(self) -> list:
+        """Returns the DeliveryResult of every batch of every message"""
+        all_results = []
         messages = self.prepare_messages()
         subscribers = self.filter_subscribers()
         for message in messages:  # send each message to all subscribers
-            status = self.notification_agent.send(message, subscribers)
-            logger.info('Message sent? {}'.format(status))
+            results = self.notification_agent.send(message, subscribers)
+            all_results.extend(results)
+            delivered = sum(len(result.get_delivered_recipients()) for result in results)
+            logger.info('Message sent to {0} of {1} subscribers'.format(delivered, len(subscribers)))
+            for result in results:
+                if not result.is_delivered():
+                    logger.error('Message not delivered. {}'.format(result))
+        return all_results
+
+
+class FanOutNotifier:
+    """
+    Run the notifiers of several channels at the same time so a slow channel does not delay the others
+
+    A notifier that raises is logged and does not stop the other channels, its exception is kept for get_failures().
+
+    :param notifiers: Objects with a notify() method e.g. a TextitNotifier per channel or an OutboxWorker per channel
+    """
+
+    def __init__(self, notifiers: list):
+        self.notifiers = notifiers
+        self.failures = []
+
+    def notify(self) -> list:
+        """Returns the result of each notifier in the order of the notifiers, None for a notifier that failed"""
+        self.failures = []
+        if len(self.notifiers) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.notifiers)) as executor:
+            futures = [executor.submit(notifier.notify) for notifier in self.notifiers]
+        results = []
+        for notifier, future in zip(self.notifiers, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.exception('{} failed'.format(type(notifier).__name__))
+                self.failures.append(e)
+                results.append(None)
+        return results
+
+    def get_failures(self) -> list:
+        """The exceptions raised by the notifiers during the last notify(), in the order of the notifiers"""
+        return self.failures
 
 
 class TexitSubscriberFilter(SubscriberFilterInterface):
-    def __init__(self):
-        self.telephone_regex = r'^947(0|1|2|5|6|7|8)\d{7}$'
-        self.filtered_subscribers = []
-
     def filter(self, subscribers: list) -> list:
-        for subscriber in subscribers:
-            if self.is_textit_compliant(subscriber):
-                self.filtered_subscribers.append(subscriber)
-        return self.filtered_subscribers
+        return [subscriber for subscriber in subscribers if self.is_textit_compliant(subscriber)]
+
+    def get_contact_type(self) -> str:
+        return 'telephone'
 
     def is_textit_compliant(self, subscriber: 'Subscriber') -> bool:
-        if re.match(self.telephone_regex, str(subscriber.get_contact())):
+        if is_telephone_number(str(subscriber.get_contact())):
             return True
         return False
 
@@ -112,38 +206,247 @@ class TexitMessageFormatter(AnnouncementFormatterInterface):
         return self.messages
 
 
+class TexitDigestFormatter(AnnouncementFormatterInterface):
+    """
+    Packs the announcements into one message of at most `max_segments` SMS segments
+
+    Announcements are added in order while the message fits. Those that do not fit are left out and counted in a last
+    line with the `overflow_url`, so a burst of announcements costs one gateway call and at most `max_segments`
+    segments per subscriber. A title with characters outside the GSM-7 alphabet makes the whole message UCS-2, which
+    fits fewer characters per segment.
+    """
+
+    def __init__(self, max_segments: int = 3,
+                 overflow_url: str = 'http://bit.lk/index.php/category/announcement/'):
+        self.max_segments = max_segments
+        self.overflow_url = overflow_url
+
+    def format(self, announcements: list) -> list:
+        if len(announcements) == 0:
+            return []
+        entries = [
+            '{0} - {1} {2}'.format(
+                announcement.get_published_datetime().strftime('%d-%b'),
+                announcement.get_title(),
+                announcement.get_url())
+            for announcement in announcements
+        ]
+        message = self.get_message(entries, 0)
+        for entry_count in range(1, len(entries) + 1):
+            candidate = self.get_message(entries, entry_count)
+            if get_segment_count(candidate) > self.max_segments:
+                break
+            message = candidate
+        return [message]
+
+    def get_message(self, entries: list, entry_count: int) -> str:
+        lines = ['(test) BIT Announcements ({}):'.format(len(entries))] + entries[:entry_count]
+        if entry_count < len(entries):
+            lines.append('+{0} more at {1}'.format(len(entries) - entry_count, self.overflow_url))
+        return NEWLINE.join(lines)
+
+
+class EmailSubscriberFilter(SubscriberFilterInterface):
+    def filter(self, subscribers: list) -> list:
+        return [subscriber for subscriber in subscribers if is_email_address(str(subscriber.get_contact()))]
+
+    def get_contact_type(self) -> str:
+        return 'email'
+
+
+class EmailMessageFormatter(AnnouncementFormatterInterface):
+    """Formats a message per announcement. The first line is used as the subject by EmailAgent"""
+
+    def format(self, announcements: list) -> list:
+        messages = []
+        for announcement in announcements:
+            messages.append(
+                'BIT Announcement: {0}\n'
+                '{0}\n\n{1}\n\nPublished on {2}\n'.format(
+                    announcement.get_title(),
+                    announcement.get_url(),
+                    announcement.get_published_datetime().strftime('%d-%b-%Y, %I:%M %p')))
+        return messages
+
+
 class TextitAgent(NotificationAgentInterface):
-    def __init__(self):
+    """
+    Send SMS through the textit.biz gateway
+
+    Recipients are split into batches of `batch_size` numbers, one request per batch, and the batches are sent
+    concurrently by at most `max_workers` threads. A batch that fails is retried up to `max_attempts` times with a
+    random (full jitter) exponential backoff starting at `backoff` seconds.
+
+    The gateway URL can be changed with the TEXTIT_URL environment variable e.g. to point at a local stub gateway.
+    """
+
+    def __init__(self, http_client: HttpClient = None, batch_size: int = 100, max_workers: int = 4,
+                 max_attempts: int = 3, backoff: float = 1.0):
+        load_environment()
+        self.http_client = http_client if http_client is not None else HttpClient()
         self.configuration = {
             'id': os.environ.get('TEXTIT_ID'),
             'pw': os.environ.get('TEXTIT_PW'),
         }
-        self.url = 'http://www.textit.biz/sendmsg/index.php'
-
-    def send(self, messages: str, recipients: list):
-        self.set_recipients(recipients)
-        self.set_message(messages)
-        logger.info('textit api call to endpoint: {}'.format(self.url))
-        response = requests.post(self.url, data=self.configuration)
-
-        logger.info('textit api call status code: {}'.format(response.status_code))
-        logger.info('textit api response status {}'.format(response.text.split(':')[0]))
-        logger.info('textit api response: {}'.format(response.text))
-        if response.status_code == 200 and response.text.split(':')[0] == 'OK':
-            return True
-        else:
-            return False
-
-    def set_recipients(self, recipients: list) -> None:
-        self.configuration['to'] = ','.join(recipients)
-
-    def set_message(self, message: str) -> None:
-        self.configuration['text'] = message
+        self.url = os.environ.get('TEXTIT_URL', 'http://www.textit.biz/sendmsg/index.php')
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def send(self, message: str, recipients: list) -> list:
+        batches = self.get_batches(recipients)
+        if len(batches) == 0:
+            return []
+        logger.info('textit api call to endpoint: {0} for {1} recipients in {2} batches'.format(
+            self.url, len(recipients), len(batches)))
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            return list(executor.map(lambda batch: self.send_batch(message, batch), batches))
+
+    def send_batch(self, message: str, recipients: list) -> DeliveryResult:
+        metrics.increment('sms_batches')
+        response_text = None
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                sleep(self.get_backoff_delay(attempt))
+            metrics.increment('sms_requests')
+            try:
+                response = self.http_client.post(self.url, data=self.get_request_data(message, recipients))
+            except requests.exceptions.RequestException as e:
+                response_text = repr(e)
+                logger.warning('textit api call attempt {0} failed: {1}'.format(attempt, response_text))
+                continue
+            response_text = response.text
+            if response.status_code == 200 and response_text.split(':')[0] == 'OK':
+                return DeliveryResult(recipients, True, attempt, response_text)
+            logger.warning('textit api call attempt {0} failed with status code {1}: {2}'.format(
+                attempt, response.status_code, response_text))
+        metrics.increment('sms_batches_failed')
+        return DeliveryResult(recipients, False, self.max_attempts, response_text)
+
+    def get_batches(self, recipients: list) -> list:
+        return [recipients[i:i + self.batch_size] for i in range(0, len(recipients), self.batch_size)]
+
+    def get_backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2 ** (attempt - 2))
+
+    def get_request_data(self, message: str, recipients: list) -> dict:
+        data = dict(self.configuration)
+        data['to'] = ','.join(recipients)
+        data['text'] = message
+        return data
+
+
+class EmailAgent(NotificationAgentInterface):
+    """
+    Send email over one SMTP connection that is kept open between messages
+
+    A message is sent once per batch of `batch_size` recipients as envelope recipients, the addresses are not put in
+    the headers. The connection is opened on the first send and opened again when the server closed it. The first line
+    of a message is its subject.
+
+    Configured with the SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_SENDER and SMTP_STARTTLS environment
+    variables.
+    """
+
+    def __init__(self, batch_size: int = 50, timeout: float = 30.0):
+        load_environment()
+        self.host = os.environ.get('SMTP_HOST', 'localhost')
+        self.port = int(os.environ.get('SMTP_PORT', 25))
+        self.user = os.environ.get('SMTP_USER')
+        self.password = os.environ.get('SMTP_PASSWORD')
+        self.sender = os.environ.get('SMTP_SENDER', 'noreply@localhost')
+        self.starttls = os.environ.get('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes')
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.connection = None
+        self.connection_count = 0
+        self.lock = threading.Lock()  # an SMTP connection carries one transaction at a time
+
+    def send(self, message: str, recipients: list) -> list:
+        email = self.create_email(message)
+        results = []
+        with self.lock:
+            for i in range(0, len(recipients), self.batch_size):
+                result = self.send_batch(email, recipients[i:i + self.batch_size])
+                metrics.increment('email_batches')
+                if not result.is_delivered():
+                    metrics.increment('email_batches_failed')
+                results.append(result)
+        logger.info('Sent email to {0} recipients in {1} batches'.format(len(recipients), len(results)))
+        return results
+
+    def send_batch(self, email: EmailMessage, recipients: list) -> DeliveryResult:
+        """
+        Send the email to a batch of recipients
+
+        Recipients the server refuses are returned in the result with the code of their refusal, the email is still
+        delivered to the others.
+        """
+        for attempt in (1, 2):  # a second attempt on a new connection if the kept open one was closed
+            try:
+                refused = self.get_connection().send_message(email, self.sender, recipients)
+            except smtplib.SMTPRecipientsRefused as e:
+                return self.get_refused_result(recipients, False, attempt, e.recipients)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                logger.warning('SMTP connection lost on attempt {0}: {1}'.format(attempt, repr(e)))
+                self.close()
+                continue
+            except (smtplib.SMTPException, OSError) as e:
+                self.close()
+                return DeliveryResult(recipients, False, attempt, repr(e))
+            if len(refused) > 0:
+                return self.get_refused_result(recipients, True, attempt, refused)
+            return DeliveryResult(recipients, True, attempt, 'OK')
+        return DeliveryResult(recipients, False, 2, 'SMTP server disconnected')
+
+    @staticmethod
+    def get_refused_result(recipients: list, delivered: bool, attempt: int, refused: dict) -> DeliveryResult:
+        """
+        :param refused: The (code, reply) of each refused recipient as smtplib returns them
+        """
+        metrics.increment('email_recipients_refused', len(refused))
+        response = 'refused: {}'.format(', '.join(
+            '{0} {1}'.format(recipient, code) for recipient, (code, reply) in refused.items()))
+        return DeliveryResult(recipients, delivered, attempt, response,
+                              {recipient: code for recipient, (code, reply) in refused.items()})
+
+    def create_email(self, message: str) -> EmailMessage:
+        subject, _, body = message.partition('\n')
+        email = EmailMessage()
+        email['Subject'] = subject
+        email['From'] = self.sender
+        email['To'] = self.sender
+        email['Date'] = formatdate(localtime=True)
+        email['Message-ID'] = make_msgid()
+        email.set_content(body)
+        return email
+
+    def get_connection(self) -> smtplib.SMTP:
+        if self.connection is None:
+            logger.info('Connecting to SMTP server {0}:{1}'.format(self.host, self.port))
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                connection.starttls()
+            if self.user:
+                connection.login(self.user, self.password)
+            self.connection = connection
+            self.connection_count += 1
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
 
 
 class TextitErrorReporter:
-    def __init__(self):
-        self.agent = TextitAgent()
+    def __init__(self, http_client: HttpClient = None):
+        self.agent = TextitAgent(http_client)
 
-    def send(self, error_message: str):
-        self.agent.send(error_message, [os.environ.get('TEXTIT_ID')])
+    def send(self, error_message: str) -> list:
+        return self.agent.send(error_message, [os.environ.get('TEXTIT_ID')])
@@ -0,0 +1,232 @@
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from psycopg2 import extensions, extras
+
+from announcement import AnnouncementCollection, AnnouncementFormatterInterface
+from database_lib import ConnectionPool
+from metrics import metrics
+from notification import NotificationAgentInterface
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationOutbox:
+    """
+    A queue table of notifications to deliver, one row per message and batch of recipients
+
+    Rows are written in the transaction that stores the announcements so an announcement is queued exactly once.
+    Workers claim rows with FOR UPDATE SKIP LOCKED, so any number of workers can deliver from the same table without
+    claiming the same row. A claimed row that is not marked sent or failed within `lease` seconds, because its worker
+    died, is claimed again, or marked failed if that was its last attempt.
+
+    :param channel: Name of the notification agent the rows are queued for e.g. 'textit'
+    :param max_attempts: A row is marked failed after this many unsuccessful deliveries
+    :param retry_delay: Seconds before a row that could not be delivered is claimed again
+    """
+
+    def __init__(self, database: ConnectionPool, channel: str = 'textit', lease: float = 300.0,
+                 max_attempts: int = 5, retry_delay: float = 60.0):
+        self.database = database
+        self.channel = channel
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def enqueue(self, announcements: AnnouncementCollection, announcement_formatter: AnnouncementFormatterInterface,
+                recipient_batches: Iterator[list], batch_size: int = 100) -> int:
+        """
+        Queue the messages of the announcements for every batch of at most batch_size recipients
+
+        A formatter may return fewer messages than announcements e.g. a digest. A message is keyed by the source and
+        check string of the announcement at its position.
+
+        :param recipient_batches: Lists of recipients e.g. one per batch of subscribers read from the subscriber store
+        :return: Number of rows queued
+        """
+        announcement_list = announcements.get_collection_list()
+        messages = list(zip(
+            [(announcement.get_source(), announcement.get_check_string()) for announcement in announcement_list],
+            announcements.format(announcement_formatter)
+        ))
+        sql = 'INSERT INTO notification_outbox(source, check_string, channel, batch_number, message, recipients) ' \
+              'VALUES %s ON CONFLICT (source, check_string, channel, batch_number) DO NOTHING'
+        queued = 0
+        batch_number = 0
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            for recipients in recipient_batches:
+                rows = []
+                for i in range(0, len(recipients), batch_size):
+                    for (source, check_string), message in messages:
+                        rows.append((source, check_string, self.channel, batch_number, message,
+                                     recipients[i:i + batch_size]))
+                    batch_number += 1
+                extras.execute_values(cursor, sql, rows, page_size=1000)
+                queued += len(rows)
+        metrics.increment('notifications_queued', queued)
+        logger.info('Queued {0} notifications for {1} announcements'.format(queued, len(announcement_list)))
+        return queued
+
+    def claim(self, worker_id: str, limit: int) -> list:
+        """
+        Claim up to limit rows that are due for delivery
+
+        Rows whose lease expired on their last attempt are marked failed first, they are never claimed again.
+
+        :return: A list of dicts with the id, message, recipients and attempts of each claimed row
+        """
+        sql = 'UPDATE notification_outbox SET status = %(sending)s, attempts = attempts + 1, ' \
+              'claimed_by = %(worker_id)s, claimed_at = now() ' \
+              'WHERE id IN (' \
+              'SELECT id FROM notification_outbox ' \
+              'WHERE channel = %(channel)s AND attempts < %(max_attempts)s AND (' \
+              '(status = %(pending)s AND available_at <= now()) OR ' \
+              '(status = %(sending)s AND claimed_at < now() - make_interval(secs => %(lease)s))) ' \
+              'ORDER BY id LIMIT %(limit)s FOR UPDATE SKIP LOCKED) ' \
+              'RETURNING id, message, recipients, attempts'
+        parameters = {
+            'pending': 'pending', 'sending': 'sending', 'worker_id': worker_id, 'channel': self.channel,
+            'max_attempts': self.max_attempts, 'lease': self.lease, 'limit': limit,
+        }
+        with self.database.transaction() as connection:
+            self.fail_expired_claims(connection.cursor())
+            cursor: extensions.cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+
+    def fail_expired_claims(self, cursor: extensions.cursor) -> list:
+        """
+        Mark failed the rows claimed for their last attempt whose worker did not mark them within the lease
+
+        :return: Ids of the rows marked failed
+        """
+        sql = 'UPDATE notification_outbox SET status = %(failed)s, last_response = %(response)s ' \
+              'WHERE channel = %(channel)s AND status = %(sending)s AND attempts >= %(max_attempts)s ' \
+              'AND claimed_at < now() - make_interval(secs => %(lease)s) ' \
+              'RETURNING id'
+        cursor.execute(sql, {
+            'failed': 'failed', 'sending': 'sending', 'channel': self.channel, 'max_attempts': self.max_attempts,
+            'lease': self.lease, 'response': 'lease expired on the last attempt',
+        })
+        outbox_ids = [row[0] for row in cursor.fetchall()]
+        if len(outbox_ids) > 0:
+            metrics.increment('notifications_failed', len(outbox_ids))
+            logger.error('Queued notifications {0} marked failed, the lease of their last attempt expired'.format(
+                ', '.join(map(str, outbox_ids))))
+        return outbox_ids
+
+    def mark_sent(self, outbox_id: int, worker_id: str, response: str, failed_recipients: list = ()) -> None:
+        """
+        :param failed_recipients: Recipients that were refused permanently, the message was sent to the others
+        """
+        sql = 'UPDATE notification_outbox SET status = %s, sent_at = now(), last_response = %s, ' \
+              'failed_recipients = failed_recipients || %s::text[] ' \
+              'WHERE id = %s AND claimed_by = %s AND status = %s'
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            cursor.execute(sql, ('sent', response, list(failed_recipients), outbox_id, worker_id, 'sending'))
+
+    def mark_unsent(self, outbox_id: int, worker_id: str, attempts: int, response: str, recipients: list = None,
+                    failed_recipients: list = ()) -> None:
+        """
+        Release a row that could not be delivered for a retry, or mark it failed after max_attempts
+
+        :param recipients: The recipients to retry, all recipients of the row if None. A row with none is failed
+        :param failed_recipients: Recipients that were refused permanently and are not retried
+        """
+        status = 'failed' if attempts >= self.max_attempts or recipients == [] else 'pending'
+        sql = 'UPDATE notification_outbox SET status = %s, last_response = %s, ' \
+              'available_at = now() + make_interval(secs => %s), recipients = coalesce(%s::text[], recipients), ' \
+              'failed_recipients = failed_recipients || %s::text[] ' \
+              'WHERE id = %s AND claimed_by = %s AND status = %s'
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            cursor.execute(sql, (status, response, self.retry_delay, recipients, list(failed_recipients), outbox_id,
+                                 worker_id, 'sending'))
+        if status == 'failed':
+            metrics.increment('notifications_failed')
+
+    def has_undelivered(self) -> bool:
+        """True if rows are waiting for a retry or being sent"""
+        sql = 'SELECT EXISTS (SELECT 1 FROM notification_outbox WHERE channel = %s AND status IN (%s, %s))'
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            cursor.execute(sql, (self.channel, 'pending', 'sending'))
+            return cursor.fetchone()[0]
+
+    def get_status_counts(self) -> dict:
+        sql = 'SELECT status, count(*) FROM notification_outbox WHERE channel = %s GROUP BY status'
+        with self.database.transaction() as connection:
+            cursor: extensions.cursor = connection.cursor()
+            cursor.execute(sql, (self.channel,))
+            return dict(cursor.fetchall())
+
+
+class OutboxWorker:
+    """
+    Deliver the rows of a notification outbox with a notification agent
+
+    Claims `max_workers` rows at a time and sends them concurrently. A row is marked sent as soon as its batch is
+    delivered, so a worker that dies resends at most the batches that were in flight. When the message was delivered
+    to some recipients of a row only the others are kept for a retry, and recipients that were refused permanently are
+    moved to the failed recipients of the row instead of being retried.
+    """
+
+    def __init__(self, outbox: NotificationOutbox, agent: NotificationAgentInterface, max_workers: int = 4,
+                 worker_id: str = None):
+        self.outbox = outbox
+        self.agent = agent
+        self.max_workers = max_workers
+        self.worker_id = worker_id if worker_id is not None else '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+    def has_undelivered(self) -> bool:
+        return self.outbox.has_undelivered()
+
+    def notify(self) -> int:
+        """Same as deliver_pending() so the workers of several channels can be run by a FanOutNotifier"""
+        return self.deliver_pending()
+
+    def deliver_pending(self) -> int:
+        """
+        Deliver rows until none are due
+
+        :return: Number of rows delivered
+        """
+        delivered = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                rows = self.outbox.claim(self.worker_id, self.max_workers)
+                if len(rows) == 0:
+                    break
+                delivered += sum(executor.map(self.deliver, rows))
+        if delivered > 0:
+            logger.info('Delivered {} queued notifications'.format(delivered))
+        return delivered
+
+    def deliver(self, row: dict) -> bool:
+        try:
+            results = self.agent.send(row['message'], row['recipients'])
+        except Exception as e:
+            logger.exception('Delivery of queued notification {} failed'.format(row['id']))
+            self.outbox.mark_unsent(row['id'], self.worker_id, row['attempts'], repr(e))
+            return False
+        response = '; '.join(str(result.get_response()) for result in results)
+        retry_recipients = [recipient for result in results for recipient in result.get_retry_recipients()]
+        failed_recipients = [recipient for result in results for recipient in result.get_failed_recipients()]
+        if len(failed_recipients) > 0:
+            logger.warning('Queued notification {0} permanently refused for {1} recipients: {2}'.format(
+                row['id'], len(failed_recipients), response))
+        if len(retry_recipients) == 0 and len(failed_recipients) < len(row['recipients']):
+            self.outbox.mark_sent(row['id'], self.worker_id, response, failed_recipients)
+            return True
+        if len(retry_recipients) > 0:
+            logger.warning('Queued notification {0} not delivered to {1} recipients on attempt {2}: {3}'.format(
+                row['id'], len(retry_recipients), row['attempts'], response))
+        # only the recipients it was not delivered to are sent the message again, with none left the row failed
+        self.outbox.mark_unsent(row['id'], self.worker_id, row['attempts'], response, retry_recipients,
+                                failed_recipients)
+        return False
@@ -0,0 +1,129 @@
+from typing import Union
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag, UnicodeDammit
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional, BeautifulSoupBackend is used without it
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:  # selectolax is optional
+    SelectolaxParser = None
+
+
+class ParserBackendInterface:
+    def find(self, html_document: bytes, html_element: str, id_attribute: Union[None, str],
+             class_attributes: str) -> Union[None, Tag]:
+        """
+        Find the first html element with the given id and class attributes
+
+        Matching follows BeautifulSoup.find(). An id of None matches elements without an id. A class string with
+        spaces must match the whole class attribute, a single class name matches any of the element's classes.
+
+        :return: The element as a BeautifulSoup4 Tag object or None if it is not found
+        """
+        pass
+
+
+class BeautifulSoupBackend(ParserBackendInterface):
+    """Parse the whole document with BeautifulSoup4 and the pure python html.parser"""
+
+    def find(self, html_document: bytes, html_element: str, id_attribute: Union[None, str],
+             class_attributes: str) -> Union[None, Tag]:
+        parse_only_article = SoupStrainer(html_element, {'id': id_attribute})
+        soup = BeautifulSoup(html_document, 'html.parser', parse_only=parse_only_article)
+        return soup.find(html_element, id=id_attribute, class_=class_attributes)
+
+
+class FragmentParserBackend(ParserBackendInterface):
+    """
+    Find the element with a C accelerated parser and build a BeautifulSoup4 Tag from the element's html only
+
+    The returned Tag is parsed by html.parser just like BeautifulSoupBackend does so the Scraper sees the same tree
+    structure, but the pure python parser only runs over the small fragment instead of the whole page.
+    """
+
+    def find(self, html_document: bytes, html_element: str, id_attribute: Union[None, str],
+             class_attributes: str) -> Union[None, Tag]:
+        fragment = self.find_fragment(self.decode(html_document), html_element, id_attribute, class_attributes)
+        if fragment is None:
+            return None
+        return BeautifulSoup(fragment, 'html.parser').find(html_element)
+
+    def find_fragment(self, html_document: str, html_element: str, id_attribute: Union[None, str],
+                      class_attributes: str) -> Union[None, str]:
+        """Returns the html of the first matching element"""
+        pass
+
+    @staticmethod
+    def decode(html_document: Union[bytes, str]) -> str:
+        if isinstance(html_document, str):
+            return html_document
+        try:
+            return html_document.decode('utf-8')
+        except UnicodeDecodeError:
+            return UnicodeDammit(html_document).unicode_markup
+
+    @staticmethod
+    def is_match(element_id: Union[None, str], element_class: Union[None, str], id_attribute: Union[None, str],
+                 class_attributes: str) -> bool:
+        if id_attribute is None:
+            if element_id:
+                return False
+        elif element_id != id_attribute:
+            return False
+        classes = (element_class or '').split()
+        if ' ' in class_attributes:
+            return ' '.join(classes) == class_attributes
+        return class_attributes in classes
+
+
+class LxmlBackend(FragmentParserBackend):
+    """Find the element with lxml (libxml2)"""
+
+    def __init__(self):
+        if lxml is None:
+            raise ImportError('LxmlBackend requires the lxml package')
+
+    def find_fragment(self, html_document: str, html_element: str, id_attribute: Union[None, str],
+                      class_attributes: str) -> Union[None, str]:
+        if html_document.strip() == '':
+            return None
+        root = lxml.html.document_fromstring(html_document)
+        for element in root.iter(html_element):
+            if self.is_match(element.get('id'), element.get('class'), id_attribute, class_attributes):
+                return lxml.html.tostring(element, encoding='unicode', with_tail=False)
+        return None
+
+
+class SelectolaxBackend(FragmentParserBackend):
+    """Find the element with selectolax (lexbor)"""
+
+    def __init__(self):
+        if SelectolaxParser is None:
+            raise ImportError('SelectolaxBackend requires the selectolax package')
+
+    def find_fragment(self, html_document: str, html_element: str, id_attribute: Union[None, str],
+                      class_attributes: str) -> Union[None, str]:
+        tree = SelectolaxParser(html_document)
+        for node in tree.css(html_element):
+            attributes = node.attributes
+            if self.is_match(attributes.get('id'), attributes.get('class'), id_attribute, class_attributes):
+                return node.html
+        return None
+
+
+def get_default_backend() -> ParserBackendInterface:
+    """
+    Returns the lxml backend, else selectolax if only it is installed, else BeautifulSoup
+
+    lxml is a pinned requirement. selectolax parses the saved pages only a few tenths of a millisecond faster (see
+    benchmarks/bench_parser_backends.py) and peaks at about ten times the memory, not worth a second parser.
+    """
+    if lxml is not None:
+        return LxmlBackend()
+    if SelectolaxParser is not None:
+        return SelectolaxBackend()
+    return BeautifulSoupBackend()
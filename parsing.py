@@ -0,0 +1,70 @@
+"""
+Precompiled patterns and fast parsers for the date, datetime and contact strings handled on every run
+"""
+import re
+from datetime import datetime
+from datetime import timezone as python_timezone
+from typing import Union
+
+from pytz import timezone
+
+LOCAL_TIMEZONE = timezone('Asia/Colombo')
+
+MONTHS = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12,
+}
+
+LISTING_DATE_PATTERN = re.compile(
+    r'^(January|February|March|April|May|June|July|August|September|October|November|December)'
+    r' (\d{1,2})(?:st|nd|rd|th), (\d{4}) by $'
+)
+ISO8601_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$')
+URL_PATTERN = re.compile(
+    r'[(http(s)?):\/\/(www\.)?a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)', re.IGNORECASE
+)
+TELEPHONE_PATTERN = re.compile(r'^947(0|1|2|5|6|7|8)\d{7}$')
+EMAIL_PATTERN = re.compile(r'(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)')
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^A-Za-z0-9]')
+
+
+def parse_listing_date(date_string: str) -> Union[None, datetime]:
+    """
+    Create a date only UTC datetime object from the date string of the announcement list e.g. "May 11th, 2020 by "
+
+    :return: The date or None if the string is not in the expected format
+    """
+    match = LISTING_DATE_PATTERN.match(date_string)
+    if match is None:
+        return None
+    month, day, year = match.groups()
+    return datetime(int(year), MONTHS[month], int(day), tzinfo=python_timezone.utc)
+
+
+def parse_iso8601(datetime_string: str) -> Union[None, datetime]:
+    """
+    Create an Asia/Colombo datetime object from an ISO8601 string with timezone e.g. "2020-08-14T10:31:52+05:30"
+
+    :return: The datetime or None if the string is not in the expected format
+    """
+    if ISO8601_PATTERN.match(datetime_string) is None:
+        return None
+    return datetime.fromisoformat(datetime_string).astimezone(LOCAL_TIMEZONE)
+
+
+def is_telephone_number(contact: str) -> bool:
+    return TELEPHONE_PATTERN.match(contact) is not None
+
+
+def is_email_address(contact: str) -> bool:
+    return EMAIL_PATTERN.match(contact) is not None
+
+
+def get_contact_type(contact: str) -> Union[None, str]:
+    """Returns 'telephone' or 'email' for a valid contact else None"""
+    contact = str(contact)
+    if is_telephone_number(contact):
+        return 'telephone'
+    if is_email_address(contact):
+        return 'email'
+    return None
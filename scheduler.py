@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime, tzinfo
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptivePollingScheduler:
+    """
+    Decide how long the daemon waits before polling the announcement page again
+
+    The interval is
+        - min_interval for a while after new announcements were found, since posts tend to come in bursts
+        - active_interval during hours of the day in which announcements were observed to be published
+        - base_interval otherwise, doubled (by backoff_factor) after every quiet poll up to max_interval
+        - base_interval doubled after every consecutive failed poll up to max_interval
+
+    :param tz: Timezone the posting hours are counted in
+    """
+
+    def __init__(self, tz: tzinfo, min_interval: float = 60, active_interval: float = 180, base_interval: float = 600,
+                 max_interval: float = 3600, backoff_factor: float = 2.0, recent_change_window: float = 1800):
+        self.tz = tz
+        self.min_interval = min_interval
+        self.active_interval = active_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.recent_change_window = recent_change_window
+        self.posting_hours = [0] * 24  # number of announcements observed in each hour of the day
+        self.last_change = None
+        self.quiet_polls = 0
+        self.failed_polls = 0
+
+    def observe_published_datetimes(self, published_datetimes: list) -> 'AdaptivePollingScheduler':
+        for published in published_datetimes:
+            if published.tzinfo is not None:
+                published = published.astimezone(self.tz)
+            if (published.hour, published.minute, published.second) == (0, 0, 0):
+                continue  # date only value scraped from the announcement list, the time is unknown
+            self.posting_hours[published.hour] += 1
+        return self
+
+    def record_change(self, published_datetimes: list, now: datetime = None) -> None:
+        self.observe_published_datetimes(published_datetimes)
+        self.last_change = now if now is not None else self.now()
+        self.quiet_polls = 0
+        self.failed_polls = 0
+
+    def record_quiet(self) -> None:
+        self.quiet_polls += 1
+        self.failed_polls = 0
+
+    def record_failure(self) -> None:
+        self.failed_polls += 1
+
+    def is_posting_hour(self, now: datetime) -> bool:
+        """An hour is a posting hour if it has at least a quarter of the announcements of the busiest hour"""
+        busiest = max(self.posting_hours)
+        return busiest > 0 and self.posting_hours[now.hour] * 4 >= busiest
+
+    def get_next_interval(self, now: datetime = None) -> float:
+        now = now if now is not None else self.now()
+        if self.failed_polls > 0:
+            interval = self.get_backoff_interval(self.failed_polls)
+        elif self.last_change is not None and (now - self.last_change).total_seconds() < self.recent_change_window:
+            interval = self.min_interval
+        elif self.is_posting_hour(now):
+            interval = self.active_interval
+        else:
+            interval = self.get_backoff_interval(self.quiet_polls - 1)
+        return min(interval, self.max_interval)
+
+    def get_backoff_interval(self, attempts: int) -> float:
+        attempts = min(max(attempts, 0), 32)  # exponent is capped, the interval is capped by max_interval anyway
+        return self.base_interval * self.backoff_factor ** attempts
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
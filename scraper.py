@@ -1,28 +1,19 @@
+import codecs
 import logging
-import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from datetime import timezone as python_timezone
-from time import sleep
+from html.parser import HTMLParser
 from typing import Union
 
-import iso8601
-import requests
-from bs4 import BeautifulSoup, SoupStrainer, Tag, NavigableString
-from pytz import timezone
+from bs4 import Tag, NavigableString
 
 from announcement import AnnouncementFactory, AnnouncementCollection
+from fetcher import DocumentFetcher, TokenBucketRateLimiter
+from metrics import metrics
+from parser_backend import ParserBackendInterface, get_default_backend
+from parsing import URL_PATTERN, parse_iso8601, parse_listing_date
 
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler('test.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
 
 
 class HTMLPartialNotFound(Exception):
@@ -60,44 +51,52 @@ class HTMLStructureMismatch(Exception):
         super().__init__(message)
 
 
-class DocumentFetcher:
-    def __init__(self):
-        self.html_document = b''
-        self.headers = {
-            'Host': 'bit.lk',
-            'Upgrade-Insecure-Requests': '1',
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                          'Chrome/84.0.4147.105 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,'
-                      'application/signed-exchange;v=b3;q=0.9',
-            'Accept-Encoding': 'gzip,deflate',
-            'Accept-Language': 'en-US,en;q=0.9'
-        }
+class TimeElementExtractor(HTMLParser):
+    """
+    Find the datetime attributes of time elements in a web page fed in chunks
 
-    def fetch_document(self, url: str) -> bytes:
-        """Download the webpage given by the url using python requests library"""
-        self.html_document = b''
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            self.html_document = response.content
-            logger.info('web page {0} fetched with status code: {1}'.format(url, response.status_code))
-            return self.html_document
-        except requests.exceptions.RequestException:
-            logger.exception('Exception raised in Scraper.fetch_document()')
-            raise
+    Only start tags are looked at, nothing else of the page is kept. A time element with several of the classes
+    e.g. class="entry-date published updated" counts for each of them.
 
-    def set_headers(self, headers: dict) -> None:
-        """Set the headers the request used to download a webpage"""
-        self.headers = headers
+    :param class_names: Class names of the time elements e.g. ('published', 'updated')
+    """
 
-    def set_user_agent(self, user_agent: str) -> None:
-        """Set an alternative user-agent header"""
-        self.headers['User-Agent'] = user_agent
+    def __init__(self, class_names: tuple):
+        super().__init__(convert_charrefs=False)
+        self.class_names = class_names
+        self.datetime_strings = {}
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag != 'time':
+            return
+        attributes = dict(attrs)
+        classes = (attributes.get('class') or '').split()
+        for class_name in self.class_names:
+            if class_name in classes and class_name not in self.datetime_strings:
+                self.datetime_strings[class_name] = attributes.get('datetime') or ''
+
+    def feed_bytes(self, chunk: bytes) -> bool:
+        """Feed the next chunk of the page. Returns True once all the time elements have been found"""
+        self.feed(self.decoder.decode(chunk))
+        return self.is_complete()
+
+    def is_complete(self) -> bool:
+        return len(self.datetime_strings) == len(self.class_names)
+
+    def get_datetime_list(self) -> list:
+        """Returns the datetime of each time element in the order of the class names"""
+        datetime_list = []
+        for class_name in self.class_names:
+            if class_name not in self.datetime_strings:
+                raise HTMLPartialNotFound('TimeElementExtractor.get_datetime_list()', 'time', None, class_name)
+            datetime_list.append(Scraper.get_datetime_from_string(self.datetime_strings[class_name]))
+        return datetime_list
 
 
 class Scraper:
-    def __init__(self):
+    def __init__(self, parser_backend: ParserBackendInterface = None):
+        self.parser_backend = parser_backend if parser_backend is not None else get_default_backend()
         self.html_document = b''
         self.html_partial = None
         self.announcement_data_list = []
@@ -107,22 +106,27 @@ class Scraper:
         return self
 
     def extract_html(self, html_element: str, id_attribute: Union[None, str], class_attributes: str) -> 'Scraper':
-        parse_only_article = SoupStrainer(html_element, {'id': id_attribute})
-        soup = BeautifulSoup(self.html_document, 'html.parser', parse_only=parse_only_article)
-        self.html_partial = soup.find(html_element, id=id_attribute, class_=class_attributes)
+        self.html_partial = self.parser_backend.find(self.html_document, html_element, id_attribute, class_attributes)
         if self.html_partial is None:
             raise HTMLPartialNotFound('Scraper.extract_html()', html_element, id_attribute, class_attributes)
         logger.info('Extracted html element "{0}"'.format(html_element))
         return self
 
     def get_datetime(self) -> datetime:
-        regex = r'^(\d{4})-(\d{2})-(\d{2})T(\d{2})\:(\d{2})\:(\d{2})[+-](\d{2})\:(\d{2})$'
         if self.html_partial.name == 'time':
-            announcement_datetime_str = self.html_partial.attrs['datetime']
-            if re.match(regex, announcement_datetime_str) is None:
-                raise ISO8601FormatMismatch()
-            announcement_datetime = iso8601.parse_date(announcement_datetime_str)
-            return announcement_datetime.astimezone(timezone('Asia/Colombo'))
+            return self.get_datetime_from_string(self.html_partial.attrs['datetime'])
+
+    @staticmethod
+    def get_datetime_from_string(datetime_string: str) -> datetime:
+        """
+        Create a datetime object in Asia/Colombo time from the datetime attribute of a time element
+
+        :param datetime_string: An ISO8601 datetime string with timezone e.g. "2020-08-14T10:31:52+05:30"
+        """
+        announcement_datetime = parse_iso8601(datetime_string)
+        if announcement_datetime is None:
+            raise ISO8601FormatMismatch()
+        return announcement_datetime
 
     def parse_announcement_data(self) -> 'Scraper':
         """
@@ -131,6 +135,7 @@ class Scraper:
         The html partial should be a Tag object returned from BeautifulSoup4.find()
         """
         logger.info('Parsing extracted html partial')
+        self.announcement_data_list = []  # the scraper is reused for every poll in daemon mode
         for tag in self.html_partial:  # there are 63 tags
             if tag.name == 'h4':
                 announcement_data = self.get_data_from_tag(tag)
@@ -164,11 +169,9 @@ class Scraper:
 
         :param a: Dictionary with announcement data
         """
-        url_regex = r'[(http(s)?):\/\/(www\.)?a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)'
-
         if a['title'] == '' or type(a['title']) is not NavigableString:
             raise AnnouncementContentNotFound('Announcement title is empty or invalid')
-        if re.match(url_regex, a['url'], re.IGNORECASE) is None:
+        if URL_PATTERN.match(a['url']) is None:
             raise AnnouncementContentNotFound('Announcement URL is invalid')
 
     def get_data_from_tag(self, tag: Tag) -> dict:
@@ -204,6 +207,7 @@ class Scraper:
         :return: An instance of AnnouncementCollection
         """
         collection = factory.get_announcement_collection(self.get_announcement_data_list())
+        metrics.increment('announcements_parsed', collection.get_size())
         return collection
 
     @staticmethod
@@ -219,53 +223,59 @@ class Scraper:
         :param date_string: A string in the format of "May 11st, 2020 by ". Note the space after word 'by '
         :return: A date only datetime object with 00:00:00 time
         """
-        regex = r'^(January|February|March?|April|May|June|July|August|September|October|November|December)' \
-                r' (\d{1,2})(st|nd|rd|th), (\d{4}) by $'
-
-        if re.match(regex, date_string) is None:
+        date = parse_listing_date(date_string)  # UTC to avoid comparison error when sorting later
+        if date is None:
             raise DateStringFormatMismatch('Scraper.get_date_from_string()', date_string)
-
-        date_list = date_string.split(' ')
-
-        if len(date_list[1]) == 5:  # i.e. '11st,' with comma
-            date_list[1] = date_list[1][0:2]
-        else:  # i.e '2nd,' no zero prefix because ordinal date
-            date_list[1] = date_list[1][0:1].zfill(1)
-
-        new_date_string = ' '.join(date_list[0:3])  # new date extracted by removing 'by', spaces and commas
-        date = datetime.strptime(new_date_string, '%B %d %Y')
-        date = date.replace(tzinfo=python_timezone.utc)  # localizing to avoid comparison error when sorting later
         return date
 
 
 class DateTimeUpdater:
     """
     Update the datetime of scraped datetime values
+
+    Announcement pages are fetched concurrently by a pool of `max_workers` threads. Requests are spaced out by the
+    rate limiter instead of waiting a fixed time after each page.
     """
 
-    def __init__(self, fetcher: DocumentFetcher, scraper: Scraper):
+    def __init__(self, fetcher: DocumentFetcher, scraper: Scraper, rate_limiter: TokenBucketRateLimiter = None,
+                 max_workers: int = 5):
         self.fetcher = fetcher
         self.scraper = scraper
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucketRateLimiter()
+        self.max_workers = max_workers
 
-    def resolve_same_day_announcements(self, collection: AnnouncementCollection):
-        same_day_announcements = collection.get_same_day_announcements()
-        for announcement in same_day_announcements:
-            logger.info('Updating published datetime of same day announcements')
-            web_page = self.fetcher.fetch_document(announcement.get_url())
-            self.scraper.set_html_document(web_page)
-            self.scraper.extract_html('time', id_attribute=None, class_attributes='published')
-            announcement.set_published_datetime(self.scraper.get_datetime())
-        return collection
+    def fetch_datetime(self, url: str, class_names: tuple) -> list:
+        """
+        Fetch an announcement page and extract the datetime of each time element given by the class names
+
+        The page is parsed while it downloads and the download stops as soon as all the time elements were seen.
+
+        :param url: URL of the announcement page
+        :param class_names: Class names of the time elements e.g. ('published', 'updated')
+        :return: A list of timezone aware datetime objects in the same order as the class names
+        """
+        self.rate_limiter.acquire(url)
+        extractor = TimeElementExtractor(class_names)
+        stream = self.fetcher.stream_document(url)
+        try:
+            for chunk in stream:
+                if extractor.feed_bytes(chunk):
+                    break
+        finally:
+            stream.close()  # aborts the download if the time elements were found before the end of the page
+        return extractor.get_datetime_list()
+
+    def fetch_all_datetime(self, announcements: list, class_names: tuple) -> list:
+        """Fetch the datetime values of all the announcements concurrently. Results are in the announcements order"""
+        if len(announcements) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(announcements))) as executor:
+            return list(executor.map(lambda a: self.fetch_datetime(a.get_url(), class_names), announcements))
 
     def update_all_datetime(self, collection: AnnouncementCollection):
         collection = collection.get_collection_list()
-        for announcement in collection:
-            web_page = self.fetcher.fetch_document(announcement.get_url())
-            self.scraper.set_html_document(web_page)
-            self.scraper.extract_html('time', id_attribute=None, class_attributes='published')
-            announcement.set_published_datetime(self.scraper.get_datetime())
-            self.scraper.extract_html('time', id_attribute=None, class_attributes='updated')
-            announcement.set_updated_datetime(self.scraper.get_datetime())
-            logger.info('waiting 4s ...')
-            sleep(4)
+        datetime_lists = self.fetch_all_datetime(collection, ('published', 'updated'))
+        for announcement, (published, updated) in zip(collection, datetime_lists):
+            announcement.set_published_datetime(published)
+            announcement.set_updated_datetime(updated)
         return collection
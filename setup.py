@@ -3,22 +3,14 @@ import sys
 import traceback
 
 from announcement import AnnouncementFactory, AnnouncementMapper, Comparator
-from database_lib import db_connection, JsonAdapter
+from database_lib import ConnectionPool, JsonAdapter
+from logging_lib import configure_logging
 from notification import TexitSubscriberFilter, TexitMessageFormatter, TextitNotifier, TextitAgent, TextitErrorReporter
 from scraper import DocumentFetcher, Scraper, DateTimeUpdater
 from subscriber import SubscriberFactory, SubscriberMapper
 
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(funcName)s(): %(message)s')
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler('app.log')
-stream_handler = logging.StreamHandler()
-file_handler.setFormatter(formatter)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+configure_logging()
 
 target_class_names = 'post-6 page type-page status-publish hentry'
 target_id_name = 'post-6'
@@ -27,7 +19,7 @@ html_element = 'article'
 scraper = Scraper()
 fetcher = DocumentFetcher()
 datetime_updater = DateTimeUpdater(fetcher, scraper)
-database = db_connection()
+database = ConnectionPool()
 factory = AnnouncementFactory()
 page_start = 1
 page_end = 1
@@ -58,3 +50,5 @@ for i in range(page_start, page_end + 1):
         # TextitErrorReporter().send(exc_type[0])
         logger.info('terminating script')
         exit(1)
+
+database.close()
@@ -0,0 +1,48 @@
+"""
+SMS length accounting: the encoding a gateway will use for a text and the number of segments it is billed as
+"""
+import math
+
+# GSM 03.38 default alphabet, a character of the extension table takes two septets (escape + character)
+GSM7_BASIC_CHARACTERS = frozenset(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+GSM7_EXTENSION_CHARACTERS = frozenset('^{}\\[~]|€\f')
+
+GSM7_SINGLE_SEGMENT = 160
+GSM7_MULTI_SEGMENT = 153  # the user data header of a concatenated message takes 7 septets
+UCS2_SINGLE_SEGMENT = 70
+UCS2_MULTI_SEGMENT = 67
+
+NEWLINE = '%0a'  # how the textit gateway expects a new line in the message text
+
+
+def is_gsm7(text: str) -> bool:
+    return all(c in GSM7_BASIC_CHARACTERS or c in GSM7_EXTENSION_CHARACTERS for c in text)
+
+
+def get_encoding(text: str) -> str:
+    """Returns 'GSM-7' if every character is in the GSM default alphabet else 'UCS-2'"""
+    return 'GSM-7' if is_gsm7(text) else 'UCS-2'
+
+
+def get_length(text: str) -> int:
+    """Returns the length of the text in septets for GSM-7 or in UTF-16 code units for UCS-2"""
+    text = text.replace(NEWLINE, '\n')
+    if is_gsm7(text):
+        return sum(2 if c in GSM7_EXTENSION_CHARACTERS else 1 for c in text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def get_segment_count(text: str) -> int:
+    """Returns the number of SMS segments the text is sent and billed as"""
+    text = text.replace(NEWLINE, '\n')
+    length = get_length(text)
+    if is_gsm7(text):
+        single, multi = GSM7_SINGLE_SEGMENT, GSM7_MULTI_SEGMENT
+    else:
+        single, multi = UCS2_SINGLE_SEGMENT, UCS2_MULTI_SEGMENT
+    if length <= single:
+        return 1
+    return math.ceil(length / multi)
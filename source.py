@@ -0,0 +1,87 @@
+"""
+The sites and categories announcements are scraped from
+
+Sources are listed in a JSON file, one object per source:
+
+    [
+        {
+            "name": "bit.lk",
+            "page_url": "http://bit.lk/index.php/category/announcement/page/{}",
+            "html_element": "article",
+            "id_name": "post-6",
+            "class_names": "post-6 page type-page status-publish hentry"
+        }
+    ]
+
+`page_url` is the url of the announcement list pages with a {} placeholder for the page number, the first page is
+polled. `html_element`, `id_name` and `class_names` select the element whose h4 children are the announcements. The
+announcements of a source are stored with its name, so the same title on two sources is two announcements.
+"""
+import json
+
+DEFAULT_SOURCE = 'bit.lk'
+
+
+class SourceConfigurationError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+class Source:
+    def __init__(self, name: str, page_url: str, html_element: str, id_name: str, class_names: str):
+        self.name = name
+        self.page_url = page_url
+        self.html_element = html_element
+        self.id_name = id_name
+        self.class_names = class_names
+
+    def __str__(self) -> str:
+        return self.name
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_page_url(self) -> str:
+        """Returns the url of the announcement list pages with a {} placeholder for the page number"""
+        return self.page_url
+
+    def get_url(self) -> str:
+        """Returns the url of the first announcement list page"""
+        return self.page_url.format(1)
+
+    def get_html_element(self) -> str:
+        return self.html_element
+
+    def get_id_name(self) -> str:
+        return self.id_name
+
+    def get_class_names(self) -> str:
+        return self.class_names
+
+
+def load_sources(sources_file: str) -> list:
+    """
+    Read the sources of the JSON file
+
+    :raises SourceConfigurationError: if a source misses a setting or two sources have the same name
+    """
+    with open(sources_file) as source_data:
+        entries = json.load(source_data)
+    sources = []
+    names = set()
+    for entry in entries:
+        try:
+            source = Source(entry['name'], entry['page_url'], entry['html_element'], entry.get('id_name'),
+                            entry['class_names'])
+        except KeyError as e:
+            raise SourceConfigurationError('Source {0} in {1} has no {2}'.format(
+                entry.get('name', len(sources)), sources_file, e.args[0])) from e
+        if source.get_name() in names:
+            raise SourceConfigurationError('Source {0} is listed twice in {1}'.format(source.get_name(), sources_file))
+        if '{}' not in source.get_page_url():
+            raise SourceConfigurationError('page_url of source {0} has no {{}} for the page number'.format(
+                source.get_name()))
+        names.add(source.get_name())
+        sources.append(source)
+    return sources
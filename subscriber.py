@@ -1,17 +1,22 @@
-import re
 from typing import TYPE_CHECKING
-from typing import Union
+from typing import Iterator, Union
 
-from database_lib import JsonAdapter
+from parsing import get_contact_type, is_email_address, is_telephone_number
 
 if TYPE_CHECKING:
     from typing import Union
 
+    from database_lib import SubscriberAdapterInterface
+
 
 class SubscriberFilterInterface:
     def filter(self, subscribers: list) -> list:
         pass
 
+    def get_contact_type(self) -> str:
+        """Returns the contact type of the subscribers the filter keeps, 'telephone' or 'email'"""
+        pass
+
 
 class Subscriber:
     def __init__(self, name: str, contact: str, status: str, date_created: 'datetime' = None,
@@ -29,6 +34,9 @@ class Subscriber:
         # email and number regex
         pass
 
+    def get_id(self) -> Union[None, str]:
+        return self.id
+
     def get_contact(self) -> str:
         return self.contact
 
@@ -43,8 +51,17 @@ class Subscriber:
 
 
 class SubscriberCollection:
+    """
+    Subscribers keyed by contact, with an index of the normalised contacts of each contact type
+
+    The index is kept up to date as subscribers are added and removed, so notifiers get the recipients of a channel
+    without filtering the whole collection on every send.
+    """
+
     def __init__(self):
         self.subscribers = {}
+        self.recipients = {}  # contact type -> normalised contacts, a dict used as an insertion ordered set
+        self.recipient_lists = {}  # contact type -> list of recipients, rebuilt after the contact type changed
 
     def __str__(self):
         if self.is_empty():
@@ -96,10 +113,40 @@ class SubscriberCollection:
             self.add_to_collection(subscriber)
         return self
 
+    def get_recipients(self, contact_type: str) -> list:
+        """
+        Returns the contacts of the given type as strings, in the order the subscribers were added
+
+        The same list is returned until a subscriber of the contact type is added or removed, do not modify it.
+        """
+        recipients = self.recipient_lists.get(contact_type)
+        if recipients is None:
+            recipients = list(self.recipients.get(contact_type, {}))
+            self.recipient_lists[contact_type] = recipients
+        return recipients
+
     def add_to_collection(self, subscriber: 'Subscriber') -> None:
         if subscriber.get_contact() in self.subscribers:
             print('{} contact is already in collection'.format(subscriber.get_contact()))
         self.subscribers[subscriber.get_contact()] = subscriber
+        contact = self.normalise_contact(subscriber.get_contact())
+        contact_type = get_contact_type(contact)
+        if contact_type is not None:
+            self.recipients.setdefault(contact_type, {})[contact] = None
+            self.recipient_lists.pop(contact_type, None)
+
+    def remove_from_collection(self, contact) -> None:
+        if self.subscribers.pop(contact, None) is None:
+            return
+        contact = self.normalise_contact(contact)
+        contact_type = get_contact_type(contact)
+        if contact_type is not None:
+            self.recipients[contact_type].pop(contact, None)
+            self.recipient_lists.pop(contact_type, None)
+
+    @staticmethod
+    def normalise_contact(contact) -> str:
+        return str(contact).strip()
 
 
 class SubscriberFactory:
@@ -108,8 +155,18 @@ class SubscriberFactory:
             subscriber_dict['name'],
             subscriber_dict['contact'],
             subscriber_dict['status'],
+            subscriber_dict.get('date_created'),
+            subscriber_dict.get('id'),
         )
 
+    @staticmethod
+    def to_dict(subscriber: 'Subscriber') -> dict:
+        return {
+            'name': subscriber.get_name(),
+            'contact': subscriber.get_contact(),
+            'status': subscriber.get_status(),
+        }
+
     def create_subscriber_collection(self, subscriber_data_list: list) -> 'SubscriberCollection':
         subscriber_list = []
         for subscriber_data in subscriber_data_list:
@@ -119,12 +176,37 @@ class SubscriberFactory:
 
 
 class SubscriberMapper:  # mapper is kind of redundant abstraction
-    def __init__(self, adapter: JsonAdapter):
+    def __init__(self, adapter: 'SubscriberAdapterInterface'):
         self.adapter = adapter
         self.factory = None
 
-    def save_all(self, collection: SubscriberCollection):
-        pass
+    def save_all(self, collection: SubscriberCollection) -> None:
+        self.adapter.save_all([SubscriberFactory.to_dict(subscriber) for subscriber in collection.get_list()])
+
+    def add_subscriber(self, subscriber: 'Subscriber') -> None:
+        """Store one subscriber. Needs an adapter with add() e.g. SubscriberTableAdapter"""
+        if not self.is_subscriber_contact_valid(subscriber.get_contact()):
+            raise ValueError('Subscriber contact "{}" is not valid'.format(subscriber.get_contact()))
+        self.adapter.add(SubscriberFactory.to_dict(subscriber))
+
+    def remove_subscriber(self, contact: str) -> None:
+        """Remove one subscriber. Needs an adapter with remove() e.g. SubscriberTableAdapter"""
+        self.adapter.remove(contact)
+
+    def iter_subscriber_batches(self, factory: 'SubscriberFactory', contact_type: str = None,
+                                batch_size: int = 1000) -> Iterator['SubscriberCollection']:
+        """
+        Yields the active subscribers in collections of at most batch_size subscribers
+
+        :param contact_type: 'telephone' or 'email', None for both
+        """
+        self.factory = factory
+        for subscriber_list_dict in self.adapter.iter_batches('active', contact_type, batch_size):
+            subscribers = [
+                factory.create_from_dict(subscriber_dict) for subscriber_dict in subscriber_list_dict
+                if self.is_subscriber_contact_valid(subscriber_dict['contact'])
+            ]
+            yield SubscriberCollection().set_collection(subscribers)
 
     def get_all_subscribers(self, factory: 'SubscriberFactory') -> 'SubscriberCollection':
         self.factory = factory
@@ -143,9 +225,6 @@ class SubscriberMapper:  # mapper is kind of redundant abstraction
     @staticmethod
     def is_subscriber_contact_valid(contact):
         contact = str(contact)
-        email_regex = r'(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)'
-        telephone_regex = r'^947(0|1|2|5|6|7|8)\d{7}$'
-
-        if re.match(telephone_regex, contact) or re.match(email_regex, contact):
+        if is_telephone_number(contact) or is_email_address(contact):
             return True
         return False
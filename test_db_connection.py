@@ -1,11 +1,10 @@
-from database_lib import db_connection
-
-connection = db_connection()
+from database_lib import ConnectionPool
 
 sql = "SELECT to_regclass('public.announcement')"
 
-cursor = connection.cursor()
-cursor.execute(sql)
-result = cursor.fetchone()
+with ConnectionPool().transaction() as connection:
+    cursor = connection.cursor()
+    cursor.execute(sql)
+    result = cursor.fetchone()
 if result is not None:
     print('Connection successful')